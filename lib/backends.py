@@ -0,0 +1,396 @@
+"""
+Frame storage backends for VideoDataSet.
+
+A backend maps (video directory, list of 1-based frame indices) to a list of
+RGB PIL images. VideoDataSet only talks to the backend through `read`, and
+through the optional `byte_ranges` for read-ahead hints (lib/prefetch.py).
+"""
+import io
+import os
+import math
+import mmap
+import struct
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+try:
+    import lmdb
+except ImportError:
+    lmdb = None
+
+try:
+    import av
+except ImportError:
+    av = None
+
+__all__ = ['ImageBackend', 'PackedBackend', 'LMDBBackend', 'VideoBackend', 'MemmapBackend',
+           'build_backend', 'write_pack', 'read_pack_index', 'lmdb_key',
+           'read_memmap_index', 'write_memmap_index']
+
+PACK_MAGIC = b'VPK1'
+PACK_SUFFIX = '.pack'
+MEMMAP_SUFFIX = '.u8'
+MEMMAP_INDEX = 'memmap_index.txt'
+
+
+def load_rgb(fp, short_side=None):
+    """Decode an image file (path or file object) to RGB.
+    If short_side is given, jpegs are decoded with libjpeg DCT scaling at the
+    smallest 1/2, 1/4 or 1/8 reduction whose short side is still >= short_side.
+    """
+    img = Image.open(fp)
+    if short_side is not None and img.format == 'JPEG':
+        w, h = img.size
+        scale = float(short_side) / min(w, h)
+        if scale < 1:
+            img.draft('RGB', (int(math.ceil(w * scale)), int(math.ceil(h * scale))))
+    return img.convert('RGB')
+
+
+def decode_jpeg(buf, short_side=None):
+    return load_rgb(io.BytesIO(buf), short_side)
+
+
+class JpegBackend(object):
+    """Common part of the backends storing encoded jpeg frames.
+    With num_threads > 1 the frames of a clip are decoded concurrently by a
+    thread pool owned by the current process (PIL releases the GIL while
+    decoding). The pool is created lazily so every DataLoader worker gets its own.
+    With a frame_cache (frame_cache.SharedFrameCache) the encoded bytes are
+    looked up there first and storage is only read for the misses.
+    """
+    def __init__(self, short_side=None, num_threads=0, frame_cache=None):
+        self.short_side = short_side
+        self.num_threads = num_threads
+        self.frame_cache = frame_cache
+        self._pool = None
+        self._pool_pid = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_pool'] = None
+        state['_pool_pid'] = None
+        return state
+
+    def _map(self, fn, items):
+        if self.num_threads <= 1 or len(items) <= 1:
+            return [fn(item) for item in items]
+        if self._pool is None or self._pool_pid != os.getpid():
+            self._pool = ThreadPoolExecutor(self.num_threads)
+            self._pool_pid = os.getpid()
+        return list(self._pool.map(fn, items))
+
+    def _decode(self, buf):
+        return decode_jpeg(buf, self.short_side)
+
+    def _cached_bytes(self, directory, indices, read_missing):
+        """Encoded frames of `indices`, from the frame cache where possible.
+        read_missing(list of indices) -> list of buffers reads the rest from storage.
+        """
+        bufs = [self.frame_cache.get(directory, idx) for idx in indices]
+        missing = [i for i, buf in enumerate(bufs) if buf is None]
+        if missing:
+            for i, buf in zip(missing, read_missing([indices[i] for i in missing])):
+                buf = bytes(buf)
+                self.frame_cache.put(directory, indices[i], buf)
+                bufs[i] = buf
+        return bufs
+
+
+class ImageBackend(JpegBackend):
+    """Loose JPEG files laid out as root_path/video/image_tmpl.format(idx)
+    """
+    def __init__(self, image_tmpl='img_{:05d}.jpg', short_side=None, num_threads=0, frame_cache=None):
+        super(ImageBackend, self).__init__(short_side, num_threads, frame_cache)
+        self.image_tmpl = image_tmpl
+
+    def _read_file(self, directory, idx):
+        with open(os.path.join(directory, self.image_tmpl.format(idx)), 'rb') as f:
+            return f.read()
+
+    def byte_ranges(self, directory, indices):
+        """(file, offset, length) that reading `indices` touches; length 0 is the whole file"""
+        return [(os.path.join(directory, self.image_tmpl.format(idx)), 0, 0) for idx in indices]
+
+    def read(self, directory, indices):
+        if self.frame_cache is not None:
+            bufs = self._cached_bytes(directory, indices,
+                                      lambda missing: [self._read_file(directory, idx) for idx in missing])
+            return self._map(self._decode, bufs)
+        return self._map(lambda idx: load_rgb(os.path.join(directory, self.image_tmpl.format(idx)),
+                                              self.short_side), indices)
+
+
+def write_pack(path, frames):
+    """Write encoded frames (list of bytes, frame 1 first) into a single shard.
+    Layout: magic | uint32 count | uint64 offsets[count + 1] | payload
+    Offsets are absolute file positions so the reader can slice directly.
+    """
+    count = len(frames)
+    header_size = len(PACK_MAGIC) + 4 + 8 * (count + 1)
+    offsets = np.zeros(count + 1, dtype=np.uint64)
+    offsets[0] = header_size
+    if count > 0:
+        offsets[1:] = header_size + np.cumsum([len(f) for f in frames], dtype=np.uint64)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PACK_MAGIC)
+        f.write(struct.pack('<I', count))
+        f.write(offsets.astype('<u8').tobytes())
+        for frame in frames:
+            f.write(frame)
+    os.rename(tmp_path, path)
+
+
+def read_pack_index(buf):
+    """Parse the offset table of a shard held in `buf` (bytes or mmap).
+    """
+    head = len(PACK_MAGIC) + 4
+    assert(buf[:len(PACK_MAGIC)] == PACK_MAGIC), "Not a frame shard."
+    count = struct.unpack('<I', buf[len(PACK_MAGIC):head])[0]
+    return np.frombuffer(buf[head:head + 8 * (count + 1)], dtype='<u8')
+
+
+class PackedBackend(JpegBackend):
+    """One shard per video (video + '.pack'), read through mmap so a clip
+    costs a single open and only the requested byte ranges are touched.
+    """
+    def _read_frames(self, directory, indices):
+        with open(directory + PACK_SUFFIX, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offsets = read_pack_index(mm)
+                return [mm[int(offsets[idx - 1]):int(offsets[idx])] for idx in indices]
+            finally:
+                mm.close()
+
+    def byte_ranges(self, directory, indices):
+        path = directory + PACK_SUFFIX
+        with open(path, 'rb') as f:
+            head = f.read(len(PACK_MAGIC) + 4)
+            count = struct.unpack('<I', head[len(PACK_MAGIC):])[0]
+            offsets = read_pack_index(head + f.read(8 * (count + 1)))
+        return [(path, int(offsets[idx - 1]), int(offsets[idx] - offsets[idx - 1])) for idx in indices]
+
+    def read(self, directory, indices):
+        if self.frame_cache is not None:
+            frames = self._cached_bytes(directory, indices, lambda missing: self._read_frames(directory, missing))
+        else:
+            frames = self._read_frames(directory, indices)
+        return self._map(self._decode, frames)
+
+
+def lmdb_key(video, idx):
+    return '{}/{:06d}'.format(video, idx).encode('ascii')
+
+
+class LMDBBackend(JpegBackend):
+    """All frames in one read-only LMDB database at `db_path`, keyed by
+    lmdb_key(video, idx) where video is the path relative to `db_path`.
+    Every DataLoader worker lazily opens its own environment.
+    """
+    def __init__(self, db_path, short_side=None, num_threads=0, frame_cache=None):
+        if lmdb is None:
+            raise ImportError("lmdb backend requires the 'lmdb' package.")
+        super(LMDBBackend, self).__init__(short_side, num_threads, frame_cache)
+        self.db_path = db_path
+        self._env = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = super(LMDBBackend, self).__getstate__()
+        state['_env'] = None
+        state['_pid'] = None
+        return state
+
+    def _get_env(self):
+        if self._env is None or self._pid != os.getpid():
+            self._env = lmdb.open(self.db_path, readonly=True, lock=False,
+                                  readahead=False, meminit=False, max_readers=1024)
+            self._pid = os.getpid()
+        return self._env
+
+    def read(self, directory, indices):
+        video = os.path.relpath(directory, self.db_path)
+        with self._get_env().begin(buffers=True) as txn:
+            def read_missing(missing):
+                bufs = []
+                for idx in missing:
+                    buf = txn.get(lmdb_key(video, idx))
+                    if buf is None:
+                        raise KeyError("frame {} of {} not in {}".format(idx, video, self.db_path))
+                    bufs.append(buf)
+                return bufs
+            if self.frame_cache is not None:
+                bufs = self._cached_bytes(directory, indices, read_missing)
+            else:
+                bufs = read_missing(indices)
+            # buffers point into the map and are only valid inside the transaction
+            return self._map(self._decode, bufs)
+
+
+class VideoBackend(object):
+    """Decode frames straight from the compressed video. The first column of
+    the list file is the video file itself (e.g. RGB_val/jf7RDuUTrsQ.mp4).
+    Frame idx is the idx-th frame in presentation order.
+
+    On first touch the packets are demuxed (no decoding) to build a keyframe
+    index, which is kept in memory and saved next to the video as
+    <video>.kfidx.npz so later epochs and workers skip the scan (written to a
+    temporary file and renamed, so workers building the same index at once
+    never read a partial one; an unreadable index is rebuilt). A read seeks to
+    the keyframe before the first requested frame and decodes forward, seeking
+    again only when the next requested frame lies behind another keyframe.
+    """
+    INDEX_SUFFIX = '.kfidx.npz'
+
+    def __init__(self):
+        if av is None:
+            raise ImportError("video backend requires the 'av' (PyAV) package.")
+        self._indices = dict()
+
+    def _build_index(self, path):
+        pts = []
+        key_pts = []
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            for packet in container.demux(stream):
+                if packet.pts is None:
+                    continue
+                pts.append(packet.pts)
+                if packet.is_keyframe:
+                    key_pts.append(packet.pts)
+        pts = np.sort(np.array(pts, dtype=np.int64))
+        key_pts = np.sort(np.array(key_pts, dtype=np.int64))
+        if len(key_pts) == 0 or key_pts[0] > pts[0]:
+            key_pts = np.concatenate([pts[:1], key_pts])
+        return pts, key_pts
+
+    def _get_index(self, path):
+        if path in self._indices:
+            return self._indices[path]
+        index_path = path + self.INDEX_SUFFIX
+        index = None
+        if os.path.exists(index_path):
+            try:
+                with np.load(index_path) as f:
+                    index = (f['pts'], f['key_pts'])
+            except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+                # truncated or from an interrupted writer, rebuild it
+                index = None
+        if index is None:
+            index = self._build_index(path)
+            # one temporary file per worker, then an atomic rename as in write_pack
+            tmp_path = '{}.{}.tmp'.format(index_path, os.getpid())
+            try:
+                with open(tmp_path, 'wb') as f:
+                    np.savez(f, pts=index[0], key_pts=index[1])
+                os.replace(tmp_path, index_path)
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+        self._indices[path] = index
+        return index
+
+    def read(self, directory, indices):
+        pts, key_pts = self._get_index(directory)
+        wanted = sorted(set(min(int(idx), len(pts)) for idx in indices))
+        wanted_pts = pts[np.array(wanted) - 1]
+        frames = dict()
+        with av.open(directory) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = 'AUTO'
+            i = 0
+            image = None
+            while i < len(wanted):
+                key = key_pts[np.searchsorted(key_pts, wanted_pts[i], side='right') - 1]
+                container.seek(int(key), stream=stream, backward=True, any_frame=False)
+                for frame in container.decode(stream):
+                    if frame.pts is None:
+                        continue
+                    if frame.pts < wanted_pts[i]:
+                        continue
+                    image = frame.to_image()
+                    while i < len(wanted) and frame.pts >= wanted_pts[i]:
+                        frames[wanted[i]] = image
+                        i += 1
+                    if i == len(wanted):
+                        break
+                    # re-seek if the next frame is cheaper to reach from a later keyframe
+                    if key_pts[np.searchsorted(key_pts, wanted_pts[i], side='right') - 1] > frame.pts:
+                        break
+                else:
+                    # stream ended early, repeat the last decoded frame
+                    assert(image is not None), "No frame decoded from {}".format(directory)
+                    for idx in wanted[i:]:
+                        frames[idx] = image
+                    break
+        return [frames[min(int(idx), len(pts))] for idx in indices]
+
+
+def read_memmap_index(root_path):
+    """{video: (num_frames, height, width)} of a memmap frame cache
+    """
+    index = dict()
+    for line in open(os.path.join(root_path, MEMMAP_INDEX)):
+        items = line.strip().split(' ')
+        index[items[0]] = tuple(int(x) for x in items[1:4])
+    return index
+
+
+def write_memmap_index(root_path, index):
+    with open(os.path.join(root_path, MEMMAP_INDEX), 'w') as f:
+        for video, shape in sorted(index.items()):
+            f.write("{} {} {} {}\n".format(video, *shape))
+
+
+class MemmapBackend(object):
+    """Frames decoded and resized once by lib.utils.build_memmap, stored as
+    raw uint8 (num_frames, height, width, 3) arrays in <video>.u8 with their
+    shapes in root_path/memmap_index.txt. Reading a clip is a slice of a
+    memmap: no decoding, and the page cache is shared by all workers.
+    """
+    def __init__(self, root_path):
+        self.root_path = root_path
+        self.index = read_memmap_index(root_path)
+
+    def read_array(self, directory, indices):
+        video = os.path.relpath(directory, self.root_path)
+        shape = self.index[video] + (3,)
+        frames = np.memmap(directory + MEMMAP_SUFFIX, dtype=np.uint8, mode='r', shape=shape)
+        return frames[np.asarray(indices) - 1]
+
+    def byte_ranges(self, directory, indices):
+        video = os.path.relpath(directory, self.root_path)
+        frame_bytes = int(np.prod(self.index[video][1:])) * 3
+        return [(directory + MEMMAP_SUFFIX, (idx - 1) * frame_bytes, frame_bytes) for idx in indices]
+
+    def read(self, directory, indices):
+        return [Image.fromarray(frame) for frame in self.read_array(directory, indices)]
+
+
+def build_backend(name, image_tmpl='img_{:05d}.jpg', root_path=None, short_side=None,
+                  num_threads=0, frame_cache=None):
+    """
+    :short_side: smallest frame short side the transforms need, jpeg backends
+                 use it to decode at reduced resolution (None: full resolution)
+    :num_threads: threads decoding the frames of one clip (0: sequential)
+    :frame_cache: SharedFrameCache of encoded frames, jpeg backends only
+    """
+    if frame_cache is not None and name not in ("image", "packed", "lmdb"):
+        raise ValueError("Frame cache is only supported by the jpeg backends, not {}".format(name))
+    if name == "image":
+        return ImageBackend(image_tmpl, short_side, num_threads, frame_cache)
+    elif name == "packed":
+        return PackedBackend(short_side, num_threads, frame_cache)
+    elif name == "lmdb":
+        return LMDBBackend(root_path, short_side, num_threads, frame_cache)
+    elif name == "video":
+        return VideoBackend()
+    elif name == "memmap":
+        return MemmapBackend(root_path)
+    else:
+        raise ValueError("Unknown storage backend: {}".format(name))
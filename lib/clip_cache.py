@@ -0,0 +1,47 @@
+"""
+Cache of final uint8 clips for deterministic phases (Val).
+"""
+import os
+import hashlib
+
+import numpy as np
+
+__all__ = ['ClipCache']
+
+
+class ClipCache(object):
+    """One row per sample in <cache_dir>/<md5(signature)>.npy, plus a
+    per-row valid flag. Both are memmaps created in the main process, so forked
+    DataLoader workers share them: a row written by any worker is reused by
+    every later pass, including later runs with the same signature.
+    """
+    def __init__(self, cache_dir, signature, num_clips, clip_shape):
+        if not os.path.exists(cache_dir):
+            os.makedirs(cache_dir, exist_ok=True)
+        key = hashlib.md5(signature.encode('utf-8')).hexdigest()
+        path = os.path.join(cache_dir, "clips_" + key)
+        shape = (num_clips,) + tuple(clip_shape)
+        if os.path.exists(path + '.valid.npy'):
+            self.clips = np.load(path + '.npy', mmap_mode='r+')
+            self.valid = np.load(path + '.valid.npy', mmap_mode='r+')
+            assert(self.clips.shape == shape), "Clip cache shape mismatch."
+        else:
+            with open(path + '.txt', 'w') as f:
+                f.write(signature + '\n')
+            self.clips = np.lib.format.open_memmap(path + '.npy', mode='w+', dtype=np.uint8, shape=shape)
+            # created last: its existence marks a fully allocated cache
+            self.valid = np.lib.format.open_memmap(path + '.valid.npy', mode='w+', dtype=np.uint8,
+                                                   shape=(num_clips,))
+        self.path = path
+
+    def get(self, index):
+        if not self.valid[index]:
+            return None
+        return np.array(self.clips[index])
+
+    def put(self, index, clip):
+        self.clips[index] = clip
+        self.valid[index] = 1
+
+    def __len__(self):
+        return int(self.valid.sum())
@@ -3,12 +3,24 @@ import torch.utils.data as data
 from PIL import Image
 import os
 import os.path
+import functools
+import warnings
+import multiprocessing
 import numpy as np
 from numpy.random import randint
 
 import torch
+import torchvision
 import ipdb
 
+from .backends import build_backend
+from .clip_cache import ClipCache
+from .video_index import VideoIndex
+from .sampling import plan_epoch
+from .transforms import required_short_side, flatten_transforms, Stack
+from .tensor_transforms import TensorStack
+from .transform_plan import plan_transforms, PlannedTransform
+
 class VideoRecord(object):
     def __init__(self, row, root_path):
         self._data = row
@@ -26,6 +38,9 @@ class VideoRecord(object):
     def label(self):
         return int(self._data[2])
 
+def _make_record(root_path, path, num_frames, label):
+    return VideoRecord((path, num_frames, label), root_path)
+
 class VideoDebugDataSet(data.Dataset):
     """
     """
@@ -42,10 +57,22 @@ class VideoDataSet(data.Dataset):
                  t_length=32, t_stride=2, num_segments=1, 
                  image_tmpl='img_{:05d}.jpg', 
                  transform=None, style="Dense", 
-                 phase="Train"):
+                 phase="Train", backend="image", draft_decode=False,
+                 decode_threads=0, cache_dir=None, seed=0, frame_cache=None):
         """
         :style: Dense, for 2D and 3D model, and Sparse for TSN model
         :phase: Train, Val, Test
+        :backend: image (loose jpegs), packed (one shard per video),
+                  lmdb (root_path is the database), video (decode mp4 directly),
+                  memmap (pre-resized uint8 frames, root_path is the cache)
+        :draft_decode: decode jpegs at the reduced resolution the transform still covers
+        :decode_threads: threads per worker decoding the frames of a clip concurrently
+        :cache_dir: Val only, keep the uint8 clips (transform up to Stack) in a
+                    memmap under cache_dir and reuse them in later passes
+        :seed: base seed of the per-epoch sampling plan, see set_epoch
+        :frame_cache: SharedFrameCache of encoded frames that all workers read and
+                      fill; create it before the DataLoader forks (can be shared
+                      between the train and val sets)
         """
 
         self.root_path = root_path
@@ -60,14 +87,120 @@ class VideoDataSet(data.Dataset):
         self.phase = phase
         assert(t_length > 0), "Length of time must be bigger than zero."
         assert(t_stride > 0), "Stride of time must be bigger than zero."
+        self.draft_decode = draft_decode
+        self.short_side = required_short_side(transform) if draft_decode and transform is not None else None
+        self.frame_cache = frame_cache
+        self.backend = build_backend(backend, image_tmpl=image_tmpl, root_path=root_path,
+                                     short_side=self.short_side, num_threads=decode_threads,
+                                     frame_cache=self.frame_cache)
+        # frame counters in shared memory, so forked workers all add to them
+        self._frames_requested = multiprocessing.Value('q', 0)
+        self._frames_decoded = multiprocessing.Value('q', 0)
 
         self._parse_list()
+        self.seed = seed
+        self.set_epoch(0)
+        # Val/Test read the plan above; Train samples per item until set_epoch
+        self._epoch_set = False
+
+        self.clip_cache = None
+        if cache_dir is not None:
+            assert(phase == "Val"), "Clip cache is only supported in the deterministic Val phase."
+            self._init_clip_cache(cache_dir, backend)
+
+    def set_epoch(self, epoch):
+        """Draw the frame indices of every sample for `epoch` at once, seeded by
+        (seed, epoch). Call before creating the epoch's DataLoader iterator so
+        the forked workers inherit the plan instead of each drawing from the
+        same inherited numpy state. A Train set that is never given an epoch
+        draws every sample's frames on access instead (_sample_indices), so
+        it does not see the same clips every epoch.
+        """
+        self.epoch = epoch
+        self._epoch_set = True
+        rng = np.random.RandomState([self.seed, epoch])
+        self.plan = plan_epoch(self.video_list.num_frames, self.phase, self.style,
+                               self.t_length, self.t_stride, self.num_segments, rng)
+
+    def _plan_indices(self, index):
+        frames = self.plan[index].tolist()
+        if self.phase == "Train" and self.style == "UnevenDense":
+            return {"dense": frames[:self.t_length], "sparse": frames[self.t_length:]}
+        return {"dense": frames}
+
+    def clip_frames(self, index):
+        """Clamped frame indices sample `index` reads in the current epoch.
+        """
+        record = self.video_list[index]
+        return np.unique(np.minimum(self.plan[index], record.num_frames))
+
+    def byte_ranges(self, index):
+        """(file, offset, length) ranges sample `index` reads in the current
+        epoch, empty if the backend cannot tell.
+        """
+        if not hasattr(self.backend, 'byte_ranges'):
+            return []
+        return self.backend.byte_ranges(self.video_list[index].path, self.clip_frames(index).tolist())
+
+    def _init_clip_cache(self, cache_dir, backend):
+        """Split the transform after Stack: the uint8 part is cached, the
+        float part (ToTorchFormatTensor, GroupNormalize) runs on every pass.
+        """
+        ops = flatten_transforms(self.transform)
+        stacks = [i for i, op in enumerate(ops) if isinstance(op, (Stack, TensorStack))]
+        assert(len(stacks) == 1), "Clip cache needs a transform with one Stack."
+        self.cache_transform = torchvision.transforms.Compose(ops[:stacks[0] + 1])
+        if isinstance(self.transform, PlannedTransform):
+            self.cache_transform = plan_transforms(self.cache_transform)
+        self.post_transform = torchvision.transforms.Compose(ops[stacks[0] + 1:])
+        # everything that changes the cached clips (draft decoding changes the
+        # decoded pixels; decode threads and the frame cache do not)
+        list_stat = os.stat(self.list_file)
+        signature = '\n'.join(map(str, [
+            os.path.abspath(self.list_file), list_stat.st_size, list_stat.st_mtime,
+            self.root_path, backend, self.image_tmpl, self.t_length, self.t_stride,
+            self.draft_decode, self.short_side] +
+            ["{}{}".format(type(op).__name__, sorted(vars(op).items())) for op in ops[:stacks[0] + 1]]))
+        clip, _ = self.get(self.video_list[0], self._plan_indices(0),
+                           self.phase, self.cache_transform)
+        self.clip_cache = ClipCache(cache_dir, signature, len(self.video_list), clip.shape)
+
+    def _get_cached(self, index, record):
+        clip = self.clip_cache.get(index)
+        if clip is None:
+            clip, _ = self.get(record, self._plan_indices(index), self.phase, self.cache_transform)
+            self.clip_cache.put(index, clip.numpy())
+        else:
+            clip = torch.from_numpy(clip)
+        return self.post_transform(clip), record.label
 
     def _load_image(self, directory, idx):
-        return [Image.open(os.path.join(directory, self.image_tmpl.format(idx))).convert('RGB')]
+        return self._load_images(directory, [idx])
+
+    def _load_images(self, directory, indices):
+        """Decode every distinct frame once and share the image between
+        all positions of the clip that use it.
+        """
+        unique = sorted(set(indices))
+        images = dict(zip(unique, self.backend.read(directory, unique)))
+        with self._frames_requested.get_lock():
+            self._frames_requested.value += len(indices)
+        with self._frames_decoded.get_lock():
+            self._frames_decoded.value += len(unique)
+        return [images[idx] for idx in indices]
+
+    def decode_stats(self, reset=False):
+        """(frames requested, frames decoded) since the last reset, over all workers
+        """
+        stats = (self._frames_requested.value, self._frames_decoded.value)
+        if reset:
+            self._frames_requested.value = 0
+            self._frames_decoded.value = 0
+        return stats
 
     def _parse_list(self):
-        self.video_list = [VideoRecord(x.strip().split(' '), self.root_path) for x in open(self.list_file)]
+        # array-backed, VideoRecords are only created on access
+        self.video_list = VideoIndex(self.list_file, functools.partial(_make_record, self.root_path))
 
     @staticmethod
     def dense_sampler(num_frames, length, stride=1):
@@ -193,53 +326,36 @@ class VideoDataSet(data.Dataset):
     def __getitem__(self, index):
         record = self.video_list[index]
 
-        if self.phase == "Train":
-            indices = self._sample_indices(record)
-            return self.get(record, indices, self.phase)
-        elif self.phase == "Val":
-            indices = self._get_val_indices(record)
-            return self.get(record, indices, self.phase)
-        elif self.phase == "Test":
-            indices = self._get_test_indices(record)
-            return self.get(record, indices, self.phase)
-        else:
+        if self.phase not in ("Train", "Val", "Test"):
             raise TypeError("Unsuported phase {}".format(self.phase))
+        if self.phase == "Val" and self.clip_cache is not None:
+            return self._get_cached(index, record)
+        if self.phase == "Train" and not self._epoch_set:
+            warnings.warn("set_epoch was never called on the train set, "
+                          "sampling frames per item instead of from the epoch plan")
+            return self.get(record, self._sample_indices(record), self.phase)
+        # frame indices come from the epoch plan, which follows
+        # _sample_indices, _get_val_indices and _get_test_indices
+        indices = self._plan_indices(index)
+        return self.get(record, indices, self.phase)
         # ipdb.set_trace()
         # return record.path, record.num_frames, indices # for debugging
 
-    def get(self, record, indices, phase):
+    def get(self, record, indices, phase, transform=None):
+        if transform is None:
+            transform = self.transform
+        # clamp indices that run past the end of the video to the last frame
+        def clamp(inds):
+            return [min(int(ind), record.num_frames) for ind in inds]
         # dense process data
         def dense_process_data():
-            images = list()
-            for ind in indices['dense']:
-                ptr = int(ind)
-                if ptr <= record.num_frames:
-                    imgs = self._load_image(record.path, ptr)
-                else:
-                    imgs = self._load_image(record.path, record.num_frames)
-                images.extend(imgs)
-            return self.transform(images)
+            images = self._load_images(record.path, clamp(indices['dense']))
+            return transform(images)
         # unevendense process data
         def unevendense_process_data():
-            dense_images = list()
-            sparse_images = list()
-            for ind in indices['dense']:
-                ptr = int(ind)
-                if ptr <= record.num_frames:
-                    imgs = self._load_image(record.path, ptr)
-                else:
-                    imgs = self._load_image(record.path, record.num_frames)
-                dense_images.extend(imgs)
-            for ind in indices['sparse']:
-                ptr = int(ind)
-                if ptr <= record.num_frames:
-                    imgs = self._load_image(record.path, ptr)
-                else:
-                    imgs = self._load_image(record.path, record.num_frames)
-                sparse_images.extend(imgs)
-
-            images = dense_images + sparse_images
-            return self.transform(images)
+            # dense frames first, then sparse frames
+            images = self._load_images(record.path, clamp(indices['dense'] + indices['sparse']))
+            return transform(images)
         if phase == "Train":
             if self.style == "Dense":
                 process_data = dense_process_data()
@@ -0,0 +1,183 @@
+"""
+Byte-budgeted cache of encoded frames shared by all DataLoader workers.
+
+Created in the main process before the workers fork, so every worker maps
+the same memory: a frame read from disk by one worker is served from RAM to
+all others afterwards, and the whole dataset is held once instead of once
+per worker.
+
+Layout (all anonymous shared memory):
+  - an arena of `capacity` bytes used as a circular log of entries
+    [int64 key | int64 length | payload, padded to 8 bytes];
+  - an open-addressing hash table key -> (arena offset, length, referenced bit),
+    sized for a full arena of frames of `min_frame_bytes` (it cannot grow
+    once the workers have forked);
+  - shared counters.
+Eviction is CLOCK over the log (an approximation of LRU): the entry at the
+tail is dropped unless it was read since it was last passed, in which case
+it is moved to the head and gets a second chance.
+"""
+import mmap
+import struct
+import hashlib
+import multiprocessing
+
+import numpy as np
+
+__all__ = ['SharedFrameCache']
+
+_HEADER = 16
+_WRAP = -1
+# counters
+_HEAD, _TAIL, _USED, _ENTRIES, _HITS, _MISSES, _EVICTIONS, _INSERTS = range(8)
+
+
+def _frame_key(video, idx):
+    h = hashlib.blake2b('{}/{}'.format(video, idx).encode('utf-8'), digest_size=8).digest()
+    key = struct.unpack('<q', h)[0]
+    # 0 marks an empty table slot and -1 a wrap in the log
+    return key if key not in (0, _WRAP) else 1
+
+
+class SharedFrameCache(object):
+    """
+    :param capacity: arena size in bytes
+    :param min_frame_bytes: smallest encoded frame expected. The hash table
+                            holds capacity / min_frame_bytes entries (25 bytes
+                            per slot, up to 2 slots per entry: 3-7% of the
+                            capacity at 1KB); with smaller frames it fills
+                            before the arena
+    """
+    def __init__(self, capacity, min_frame_bytes=1024):
+        assert(capacity >= 1 << 20), "Frame cache needs at least 1MB."
+        self.capacity = int(capacity) // 8 * 8
+        num_slots = 1
+        while num_slots * 3 // 4 < max(self.capacity // min_frame_bytes, 1024):
+            num_slots *= 2
+        self.max_entries = num_slots * 3 // 4
+        self.lock = multiprocessing.Lock()
+        self._arena = mmap.mmap(-1, self.capacity)
+        # table columns and counters in one shared block: keys | offsets | lengths | ref | counters
+        self._table = mmap.mmap(-1, num_slots * 25 + 8 * 8)
+        self.keys = np.frombuffer(self._table, dtype=np.int64, count=num_slots, offset=0)
+        self.offsets = np.frombuffer(self._table, dtype=np.int64, count=num_slots, offset=8 * num_slots)
+        self.lengths = np.frombuffer(self._table, dtype=np.int64, count=num_slots, offset=16 * num_slots)
+        self.ref = np.frombuffer(self._table, dtype=np.uint8, count=num_slots, offset=24 * num_slots)
+        self.counters = np.frombuffer(self._table, dtype=np.int64, count=8, offset=25 * num_slots)
+        self.mask = num_slots - 1
+
+    def __getstate__(self):
+        raise TypeError("SharedFrameCache lives in memory inherited by fork; it cannot be pickled.")
+
+    def _find(self, key):
+        """Table slot holding `key`, or the empty slot where it would go."""
+        slot = key & self.mask
+        while self.keys[slot] != 0 and self.keys[slot] != key:
+            slot = (slot + 1) & self.mask
+        return slot
+
+    def _remove(self, slot):
+        """Delete a table slot with backward-shift, keeping probe chains intact."""
+        self.keys[slot] = 0
+        nxt = (slot + 1) & self.mask
+        while self.keys[nxt] != 0:
+            home = self.keys[nxt] & self.mask
+            # move the entry back if its home is not in (slot, nxt]
+            if (nxt - home) & self.mask >= (nxt - slot) & self.mask:
+                self.keys[slot] = self.keys[nxt]
+                self.offsets[slot] = self.offsets[nxt]
+                self.lengths[slot] = self.lengths[nxt]
+                self.ref[slot] = self.ref[nxt]
+                self.keys[nxt] = 0
+                slot = nxt
+            nxt = (nxt + 1) & self.mask
+
+    def get(self, video, idx):
+        key = _frame_key(video, idx)
+        with self.lock:
+            slot = self._find(key)
+            if self.keys[slot] == 0:
+                self.counters[_MISSES] += 1
+                return None
+            self.ref[slot] = 1
+            self.counters[_HITS] += 1
+            off = int(self.offsets[slot]) + _HEADER
+            return self._arena[off:off + int(self.lengths[slot])]
+
+    def put(self, video, idx, buf):
+        size = _HEADER + (len(buf) + 7) // 8 * 8
+        if size > self.capacity // 2:
+            return
+        key = _frame_key(video, idx)
+        with self.lock:
+            if self.keys[self._find(key)] != 0:
+                return
+            while self.counters[_ENTRIES] >= self.max_entries:
+                self._evict()
+            self._insert(key, buf, size)
+            self.counters[_INSERTS] += 1
+
+    def _insert(self, key, buf, size):
+        c = self.counters
+        while True:
+            head, tail, used = int(c[_HEAD]), int(c[_TAIL]), int(c[_USED])
+            if used == 0:
+                c[_HEAD] = c[_TAIL] = head = 0
+                break
+            if head > tail or (head == tail and used < self.capacity):
+                # free space runs from head to the end of the arena
+                if self.capacity - head >= size:
+                    break
+                if self.capacity - head >= _HEADER:
+                    self._arena[head:head + 8] = struct.pack('<q', _WRAP)
+                c[_USED] += self.capacity - head
+                c[_HEAD] = 0
+            elif tail - head >= size:
+                break
+            else:
+                self._evict()
+        struct.pack_into('<qq', self._arena, head, key, len(buf))
+        self._arena[head + _HEADER:head + _HEADER + len(buf)] = buf
+        slot = self._find(key)
+        self.keys[slot] = key
+        self.offsets[slot] = head
+        self.lengths[slot] = len(buf)
+        self.ref[slot] = 0
+        c[_HEAD] = (head + size) % self.capacity
+        c[_USED] += size
+        c[_ENTRIES] += 1
+
+    def _evict(self):
+        """Drop (or give a second chance to) the entry at the tail of the log."""
+        c = self.counters
+        tail = int(c[_TAIL])
+        if self.capacity - tail < _HEADER or struct.unpack_from('<q', self._arena, tail)[0] == _WRAP:
+            c[_USED] -= self.capacity - tail
+            c[_TAIL] = 0
+            return
+        key, length = struct.unpack_from('<qq', self._arena, tail)
+        size = _HEADER + (length + 7) // 8 * 8
+        slot = self._find(key)
+        c[_TAIL] = (tail + size) % self.capacity
+        c[_USED] -= size
+        c[_ENTRIES] -= 1
+        if self.ref[slot]:
+            buf = self._arena[tail + _HEADER:tail + _HEADER + length]
+            self._remove(slot)
+            self._insert(key, buf, size)
+        else:
+            self._remove(slot)
+            c[_EVICTIONS] += 1
+
+    def stats(self, reset=False):
+        """Counters since creation (or the last reset) and the current fill."""
+        with self.lock:
+            c = self.counters
+            ret = dict(hits=int(c[_HITS]), misses=int(c[_MISSES]), evictions=int(c[_EVICTIONS]),
+                       inserts=int(c[_INSERTS]), entries=int(c[_ENTRIES]), bytes=int(c[_USED]))
+            if reset:
+                c[_HITS] = c[_MISSES] = c[_EVICTIONS] = c[_INSERTS] = 0
+        return ret
+
+    def __len__(self):
+        return int(self.counters[_ENTRIES])
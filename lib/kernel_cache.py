@@ -0,0 +1,67 @@
+"""
+Cache of the time-collapsed (summed over dim 2) 3D kernels the shadow
+network runs with. An entry stays valid while the parameter it came from
+keeps its tensor version counter and storage, i.e. until an optimizer step,
+load_state_dict or a device/dtype move changes it; frozen weights (eval)
+are therefore collapsed once per checkpoint.
+
+The cache lives in the __dict__ of the owning module, which DataParallel
+replicas share, and is keyed by device. Replicas see fresh broadcast copies
+of the weights every forward, so validity is checked on the original
+parameters given at construction.
+"""
+import torch
+
+__all__ = ['CollapsedKernelCache', 'collapse_time']
+
+
+def collapse_time(weight, keepdim=True):
+    """(O, I, T, H, W) -> (O, I, 1, H, W), summed over time
+    (O, I, H, W) with keepdim=False, for 2D layers
+    """
+    if not keepdim and weight.shape[2] == 1:
+        return weight.squeeze(2)
+    return weight.sum(dim=2, keepdim=keepdim)
+
+
+class CollapsedKernelCache(object):
+    """get(index, param): collapse_time(param), computed again only when
+    sources[index] changed. With autograd on, a collapsed kernel is only
+    reused for the very tensor it was computed from (several forwards before
+    one backward), so gradients always reach the weights of this step.
+    """
+    def __init__(self, sources, keepdim=True):
+        self.sources = list(sources)
+        self.keepdim = keepdim
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _stamp(self, index):
+        source = self.sources[index]
+        return source._version, source.data_ptr(), source.dtype
+
+    def get(self, index, param):
+        key = (index, param.device)
+        stamp = self._stamp(index)
+        grad = torch.is_grad_enabled() and param.requires_grad
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == stamp:
+            _, origin, collapsed = entry
+            if (origin is param) if grad else not collapsed.requires_grad:
+                self.hits += 1
+                return collapsed
+        self.misses += 1
+        collapsed = collapse_time(param, self.keepdim)
+        # keep the origin only to recognize it, not in no-grad mode
+        self.entries[key] = (stamp, param if grad else None, collapsed)
+        return collapsed
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self, reset=False):
+        hits, misses = self.hits, self.misses
+        if reset:
+            self.hits = self.misses = 0
+        return {"hits": hits, "misses": misses}
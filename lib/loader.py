@@ -0,0 +1,161 @@
+"""
+Wrappers around torch.utils.data.DataLoader, and a ring buffer loader for
+fixed-shape clip batches.
+"""
+import queue
+import random
+import warnings
+import traceback
+import multiprocessing
+
+import torch
+import torchvision
+
+from .transforms import ToNormalizedTensor
+
+__all__ = ['BatchTransformLoader', 'RingBufferLoader']
+
+# seconds between liveness checks of the ring workers while waiting for a batch
+_STATUS_CHECK_INTERVAL = 5.0
+
+
+class BatchTransformLoader(object):
+    """Apply `transform` to every collated input batch in the main process.
+    Used with datasets whose transform stops at Stack: the workers then ship
+    uint8 clips (a quarter of the float32 bytes through shared memory and
+    pin_memory), and the batch is moved to `device` before it is converted
+    and normalized in one vectorized op (see transforms.BatchNormalize).
+    """
+    def __init__(self, loader, transform, device=None):
+        self.loader = loader
+        self.transform = transform
+        self.device = device
+        self.dataset = loader.dataset
+
+    def __iter__(self):
+        for input, target in self.loader:
+            if self.device is not None:
+                input = input.to(self.device, non_blocking=True)
+            yield self.transform(input), target
+
+    def __len__(self):
+        return len(self.loader)
+
+
+def _ring_worker(dataset, slots, targets, task_queue, done_queue, seed):
+    random.seed(seed)
+    torch.manual_seed(seed)
+    torch.set_num_threads(1)
+    # write the normalized clip straight into the slot instead of a temporary
+    normalize = None
+    name = 'post_transform' if getattr(dataset, 'clip_cache', None) is not None else 'transform'
+    transform = getattr(dataset, name, None)
+    if isinstance(transform, torchvision.transforms.Compose) and transform.transforms \
+            and isinstance(transform.transforms[-1], ToNormalizedTensor):
+        normalize = transform.transforms[-1]
+        setattr(dataset, name, torchvision.transforms.Compose(transform.transforms[:-1]))
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        batch_idx, slot, indices = task
+        try:
+            for row, index in enumerate(indices):
+                clip, label = dataset[index]
+                if normalize is not None:
+                    normalize(clip, out=slots[slot, row])
+                else:
+                    slots[slot, row].copy_(clip)
+                targets[slot, row] = label
+            done_queue.put((batch_idx, slot, None))
+        except Exception:
+            done_queue.put((batch_idx, slot, traceback.format_exc()))
+
+
+class RingBufferLoader(object):
+    """DataLoader replacement for datasets whose samples all have the same
+    shape (VideoDataSet with a fixed config). `num_slots` batch buffers are
+    allocated once in shared memory; every worker builds a whole batch and
+    writes each clip straight into its slot and row, so there is no per-sample
+    pickling, no collate copy and no allocation per step.
+
+    The (input, target) batches yielded are views of a slot, valid until the
+    next batch is requested (move or copy them before that, as the training
+    loop does with .cuda()). The slots are not pinned.
+    """
+    def __init__(self, dataset, batch_size=1, shuffle=False, drop_last=False,
+                 num_workers=1, num_slots=None):
+        assert(num_workers > 0), "RingBufferLoader needs at least one worker."
+        self.dataset = dataset
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.drop_last = drop_last
+        self.num_workers = num_workers
+        self.num_slots = num_slots if num_slots else 2 * num_workers
+        # the sample shape fixes the slot layout; the probe runs before the
+        # training loop sets the epoch, which sample 0 is drawn from does not matter
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            clip, _ = dataset[0]
+        self.slots = torch.empty((self.num_slots, batch_size) + tuple(clip.shape),
+                                 dtype=clip.dtype).share_memory_()
+        self.targets = torch.empty((self.num_slots, batch_size), dtype=torch.long).share_memory_()
+
+    def __len__(self):
+        if self.drop_last:
+            return len(self.dataset) // self.batch_size
+        return (len(self.dataset) + self.batch_size - 1) // self.batch_size
+
+    def _batches(self):
+        if self.shuffle:
+            order = torch.randperm(len(self.dataset)).tolist()
+        else:
+            order = list(range(len(self.dataset)))
+        return [order[i:i + self.batch_size] for i in range(0, len(self) * self.batch_size, self.batch_size)]
+
+    def __iter__(self):
+        batches = self._batches()
+        ctx = multiprocessing.get_context('fork')
+        task_queue, done_queue = ctx.Queue(), ctx.Queue()
+        base_seed = int(torch.empty((), dtype=torch.int64).random_().item())
+        workers = [ctx.Process(target=_ring_worker,
+                               args=(self.dataset, self.slots, self.targets, task_queue, done_queue,
+                                     (base_seed + i) % 2 ** 32))
+                   for i in range(self.num_workers)]
+        for w in workers:
+            w.daemon = True
+            w.start()
+        try:
+            free = list(range(self.num_slots))
+            sent = 0
+            ready = {}
+            for batch_idx, indices in enumerate(batches):
+                while free and sent < len(batches):
+                    task_queue.put((sent, free.pop(), batches[sent]))
+                    sent += 1
+                while batch_idx not in ready:
+                    try:
+                        done_idx, slot, error = done_queue.get(timeout=_STATUS_CHECK_INTERVAL)
+                    except queue.Empty:
+                        # a killed worker (OOM, decoder crash) never reports back
+                        for w in workers:
+                            if not w.is_alive():
+                                raise RuntimeError("RingBufferLoader worker (pid {}) exited unexpectedly "
+                                                   "with exit code {}".format(w.pid, w.exitcode))
+                        continue
+                    if error is not None:
+                        raise RuntimeError("RingBufferLoader worker failed:\n" + error)
+                    ready[done_idx] = slot
+                slot = ready.pop(batch_idx)
+                n = len(indices)
+                yield self.slots[slot, :n], self.targets[slot, :n]
+                # the consumer is done with the previous views
+                free.append(slot)
+            for _ in workers:
+                task_queue.put(None)
+            for w in workers:
+                w.join()
+        finally:
+            for w in workers:
+                if w.is_alive():
+                    w.terminate()
@@ -1,4 +1,8 @@
 import os
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from torch import nn
 from torch.nn.parameter import Parameter
 from .networks.mnet2 import mnet2
@@ -6,11 +10,63 @@ from .networks.mnet2_3d import mnet2_3d
 from .networks.resnet import *
 from .networks.resnet_3d import *
 from .networks.shadownet import resnet50_shadow
+from .networks.shadownet_2d import resnet50_shadow_2d
+from .stateless import strip_state, functional_call
+from .kernel_cache import CollapsedKernelCache, collapse_time
 
 from .transforms import *
+from .tensor_transforms import TensorMultiScaleCrop, TensorRandomHorizontalFlip
 
 import ipdb
 
+_shadow_executors = {}
+_shadow_executors_lock = threading.Lock()
+
+
+def _set_worker_threads(num_threads):
+    # with the OpenMP backend torch.set_num_threads only sets the calling
+    # thread's OpenMP (and, in current builds, MKL) thread count; the native
+    # and TBB backends resize one process-wide pool, which would also slow
+    # down the base branch, so leave those alone
+    if 'parallel backend: OpenMP' not in torch.__config__.parallel_info():
+        warnings.warn("shadow_threads needs the OpenMP parallel backend, ignored")
+        return
+    torch.set_num_threads(num_threads)
+
+
+def shadow_executor(device, num_threads=0):
+    """Worker thread for the shadow branches on `device`, one per device and
+    intra-op thread count (set in the worker when num_threads > 0), so the
+    DataParallel replicas on different gpus do not wait for each other.
+    Builds of torch whose set_num_threads calls the global
+    mkl_set_num_threads also change the MKL threads of every other thread.
+    """
+    key = (torch.device(device), num_threads)
+    with _shadow_executors_lock:
+        if key not in _shadow_executors:
+            initializer = (lambda: _set_worker_threads(num_threads)) if num_threads > 0 else None
+            _shadow_executors[key] = ThreadPoolExecutor(max_workers=1, initializer=initializer)
+        return _shadow_executors[key]
+
+
+def _drop_shadow_keys(state_dict, prefix, *args):
+    """load_state_dict pre-hook of VideoShadowModule and of every shadow module.
+    The shadow network holds no state of its own (its batchnorm buffers are
+    non-persistent copies of the base ones), so shadow_model.* keys are never
+    loaded: older checkpoints saved those copies, and stock batchnorm re-adds
+    num_batches_tracked (before its own pre-hooks run) for checkpoints
+    without shadow metadata.
+    """
+    for key in [k for k in state_dict if k.startswith(prefix) and 'shadow_model.' in k]:
+        del state_dict[key]
+
+
+def _with_grad_mode(enabled, fn):
+    # grad mode is thread local, carry the caller's over
+    with torch.set_grad_enabled(enabled):
+        return fn()
+
+
 class VideoModule(nn.Module):
     def __init__(self, num_class, base_model_name='resnet50', 
                  before_softmax=True, dropout=0.8, pretrained=True, pretrained_model=None):
@@ -78,13 +134,37 @@ class VideoModule(nn.Module):
 
         return out
 
-    def get_augmentation(self):
+    def get_augmentation(self, tensor=False):
+        if tensor:
+            # same sampling, applied to a (T, C, H, W) clip from ClipToTensor
+            return torchvision.transforms.Compose([TensorMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
+                                                   TensorRandomHorizontalFlip()])
         return torchvision.transforms.Compose([GroupMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
                                                    GroupRandomHorizontalFlip()])
 
 class VideoShadowModule(nn.Module):
     def __init__(self, num_class, base_model_name='resnet50_3d', 
-                 before_softmax=True, dropout=0.8, pretrained=True, pretrained_model=None):
+                 before_softmax=True, dropout=0.8, pretrained=True, pretrained_model=None,
+                 persistent_shadow=True, functional_shadow=False, cache_kernels=True,
+                 shadow_2d=True, concurrent_shadow=False, shadow_threads=0):
+        """
+        :persistent_shadow: build the shadow network once and only rebind the
+                            collapsed base weights every step (False: rebuild
+                            and recast it in every forward)
+        :functional_shadow: build the shadow network from stock nn layers with
+                            no state and run it through lib.stateless with the
+                            collapsed base weights (implies persistent_shadow)
+        :cache_kernels: collapse a 3D kernel again only after its weights changed
+                        (lib/kernel_cache.py), persistent shadow only
+        :shadow_2d: fold the shadow frames into the batch and run the 2D shadow
+                    network (shadownet_2d.py) instead of 3D layers with time
+                    kernel 1, persistent shadow only
+        :concurrent_shadow: run the shadow branch in a worker thread while this
+                            thread runs the base branch (forward only, autograd
+                            runs the backward of both as usual)
+        :shadow_threads: intra-op threads of that worker (0: torch default),
+                         OpenMP parallel backend only
+        """
         super(VideoShadowModule, self).__init__()
         self.num_class = num_class
         self.base_model_name = base_model_name
@@ -95,6 +175,24 @@ class VideoShadowModule(nn.Module):
 
         self._prepare_base_model(base_model_name)
         self.shadow_model_name = base_model_name.split('_')[0] + '_shadow'
+        self.persistent_shadow = persistent_shadow or functional_shadow
+        self.functional_shadow = functional_shadow
+        self.shadow_2d = shadow_2d and self.persistent_shadow
+        if self.shadow_2d:
+            self.shadow_model_name += '_2d'
+        if functional_shadow:
+            self._prepare_shadow_model(plain=True)
+            self._build_functional_bindings()
+        elif persistent_shadow:
+            self._prepare_shadow_model()
+            self._build_shadow_bindings()
+        # indexed like base_model.parameters(), as the parameter bindings
+        self._kernel_cache = CollapsedKernelCache(self.base_model.parameters(), keepdim=not self.shadow_2d) \
+                             if cache_kernels and self.persistent_shadow else None
+
+        self.concurrent_shadow = concurrent_shadow
+        self.shadow_threads = shadow_threads
+        self._register_load_state_dict_pre_hook(_drop_shadow_keys)
 
         if not self.before_softmax:
             self.softmax = nn.Softmax()
@@ -150,10 +248,20 @@ class VideoShadowModule(nn.Module):
             # print("load classifier")
             # self.classifier.load_state_dict(classifier_dict)
 
-    def _prepare_shadow_model(self):
+    def train(self, mode=True):
+        super(VideoShadowModule, self).train(mode)
+        # the shadow network used to be rebuilt in every forward, so its
+        # batchnorm always normalized with batch statistics; keep that in eval
+        if 'shadow_model' in self._modules:
+            self.shadow_model.train()
+        return self
+
+    def _prepare_shadow_model(self, plain=False):
         # shadow model (currently only support resnet50_shadow)
         if "resnet" in self.shadow_model_name:
-            self.shadow_model = eval(self.shadow_model_name)(feat=True)
+            self.shadow_model = eval(self.shadow_model_name)(feat=True, plain=plain)
+            for module in self.shadow_model.modules():
+                module._register_load_state_dict_pre_hook(_drop_shadow_keys)
         else:
             raise ValueError('Unknown shadow model: {}'.format())
 
@@ -193,7 +301,112 @@ class VideoShadowModule(nn.Module):
             # if shadow_module.shapes[buffer_name] == :
                 # print(buffer_name, buffer.shape, shadow_module.shapes[buffer_name])
             # assert(buffer.shape == shadow_module.shapes[buffer_name]), "buffer shape mismatch"
-            shadow_module.register_buffer(buffer_name, buffer)
+            # copies of the base statistics, not part of the checkpoint
+            shadow_module.register_buffer(buffer_name, buffer, persistent=False)
+
+    def _build_shadow_bindings(self):
+        """Check once what _cast_shadow checks every step and record, by module
+        position in modules() order (the same in DataParallel replicas), which
+        base parameter/buffer feeds which shadow module. The shadow buffers are
+        registered here and only refreshed in place afterwards.
+        """
+        base_index = dict((name, i) for i, (name, _) in enumerate(self.base_model.named_modules()))
+        shadow_modules = list(self.shadow_model.named_modules())
+        shadow_index = dict((name, i) for i, (name, _) in enumerate(shadow_modules))
+
+        self._param_bindings = []
+        for name, param in self.base_model.named_parameters():
+            module_name, param_name = name.rsplit('.', 1)
+            assert(param_name in ('weight', 'bias')), "parameter type must be weight or bias"
+            assert(module_name in shadow_index), "Name not in shadow_module_names"
+            shadow_module = shadow_modules[shadow_index[module_name]][1]
+            collapse, shape = self._shadow_shape(param)
+            assert(shape == shadow_module.shapes[param_name]), "param shape mismatch"
+            self._param_bindings.append((shadow_index[module_name], base_index[module_name], param_name, collapse))
+        # every nonleaf slot of a shadow module, so unbound ones (bias=False) stay None
+        self._shadow_nonleaf_names = dict((i, list(m._nonleaf_parameters.keys()))
+                                          for i, (_, m) in enumerate(shadow_modules)
+                                          if hasattr(m, '_nonleaf_parameters'))
+
+        self._buffer_bindings = []
+        for name, buffer in self.base_model.named_buffers():
+            module_name, buffer_name = name.rsplit('.', 1)
+            assert(buffer_name in ('running_mean', 'running_var', 'num_batches_tracked')), "buffer type constrain"
+            assert(module_name in shadow_index), "Name not in shadow_module_names"
+            shadow_modules[shadow_index[module_name]][1].register_buffer(buffer_name, buffer.detach().clone(),
+                                                                         persistent=False)
+            self._buffer_bindings.append((shadow_index[module_name], base_index[module_name], buffer_name))
+
+    def _shadow_shape(self, param):
+        """(whether to collapse it, shape in the shadow network) of a base parameter"""
+        if param.dim() != 5 or (param.shape[2] == 1 and not self.shadow_2d):
+            return False, param.shape
+        if self.shadow_2d:
+            return True, param.shape[:2] + param.shape[3:]
+        return True, param.shape[:2] + (1,) + param.shape[3:]
+
+    def _collapse(self, index, param):
+        if self._kernel_cache is None:
+            return collapse_time(param, keepdim=not self.shadow_2d)
+        return self._kernel_cache.get(index, param)
+
+    def _bind_shadow(self):
+        """Per-step part of _cast_shadow on the persistent shadow network:
+        collapse the 3D kernels over time and bind them, and reset the shadow
+        batchnorm statistics to the base ones.
+        """
+        base_modules = list(self.base_model.modules())
+        shadow_modules = list(self.shadow_model.modules())
+        nonleaf = dict((i, OrderedDict.fromkeys(names)) for i, names in self._shadow_nonleaf_names.items())
+        for i, (shadow_idx, base_idx, name, collapse) in enumerate(self._param_bindings):
+            param = getattr(base_modules[base_idx], name)
+            if collapse:
+                param = self._collapse(i, param)
+            nonleaf[shadow_idx][name] = param
+        # fresh dicts, a DataParallel replica shares the original's otherwise
+        for shadow_idx, params in nonleaf.items():
+            shadow_modules[shadow_idx].__dict__['_nonleaf_parameters'] = params
+        with torch.no_grad():
+            for shadow_idx, base_idx, name in self._buffer_bindings:
+                shadow_modules[shadow_idx]._buffers[name].copy_(base_modules[base_idx]._buffers[name])
+
+    def _build_functional_bindings(self):
+        """Strip the (plain) shadow network and record which base tensor, by
+        module position in modules() order, becomes each shadow tensor.
+        """
+        shapes = strip_state(self.shadow_model)
+        base_index = dict((name, i) for i, (name, _) in enumerate(self.base_model.named_modules()))
+        self._functional_bindings = []
+        for name, param in self.base_model.named_parameters():
+            module_name, param_name = name.rsplit('.', 1)
+            assert(param_name in ('weight', 'bias')), "parameter type must be weight or bias"
+            assert(name in shapes), "Name not in shadow model"
+            collapse, shape = self._shadow_shape(param)
+            assert(tuple(shape) == shapes[name]), "param shape mismatch"
+            self._functional_bindings.append((name, base_index[module_name], param_name,
+                                              "collapse" if collapse else "param"))
+        for name, buffer in self.base_model.named_buffers():
+            module_name, buffer_name = name.rsplit('.', 1)
+            assert(buffer_name in ('running_mean', 'running_var', 'num_batches_tracked')), "buffer type constrain"
+            assert(name in shapes), "Name not in shadow model"
+            self._functional_bindings.append((name, base_index[module_name], buffer_name, "buffer"))
+        assert(len(self._functional_bindings) == len(shapes)), "shadow tensor without a base tensor"
+
+    def _shadow_tensors(self):
+        """{shadow tensor name: tensor} of this step: the base weights, with 3D
+        kernels summed over time, and copies of the base batchnorm statistics
+        (the shadow network's updates of them are dropped).
+        """
+        base_modules = list(self.base_model.modules())
+        tensors = OrderedDict()
+        for i, (name, base_idx, attr, kind) in enumerate(self._functional_bindings):
+            tensor = getattr(base_modules[base_idx], attr)
+            if kind == "collapse":
+                tensor = self._collapse(i, tensor)
+            elif kind == "buffer":
+                tensor = tensor.detach().clone()
+            tensors[name] = tensor
+        return tensors
 
     def _aggregate(self, sparse_pred):
         # assert(dense_pred.dim() == 2 and sparse_pred.dim() == 3), "Prediction dimension error."
@@ -207,34 +420,79 @@ class VideoShadowModule(nn.Module):
         out = sparse_pred.sum(dim=2, keepdim=False).div(num_segments)
         return out
 
-    def forward(self, input):
-        base_input = input[:,:,:16,...]
+    def _base_branch(self, base_input):
         # Infer 3D network
-        # print("<--device: {} | befor forward conv1.weight: {}-->\n".format(input.device, self.base_model.conv1.weight[:10,0,0,0,0]))
-        # print("<--device: {} | befor forward bn1.running_mean: {}-->\n".format(input.device, self.base_model.bn1.running_mean[:10]))
+        # print("<--device: {} | befor forward conv1.weight: {}-->\n".format(base_input.device, self.base_model.conv1.weight[:10,0,0,0,0]))
+        # print("<--device: {} | befor forward bn1.running_mean: {}-->\n".format(base_input.device, self.base_model.bn1.running_mean[:10]))
         out_base = self.base_model(base_input)
         out = self.classifier(out_base)
         if not self.before_softmax:
             out = self.softmax(out)
-        # print("<--device: {} | after forward conv1.weight: {}-->\n".format(input.device, self.base_model.conv1.weight[:10,0,0,0,0]))
-        # print("<--device: {} | after forward bn1.running_mean: {}-->\n".format(input.device, self.base_model.bn1.running_mean[:10]))
-        if input.shape[2] > 16:
-            self._prepare_shadow_model()
-            shadow_input = input[:,:,16:,...]
+        # print("<--device: {} | after forward conv1.weight: {}-->\n".format(base_input.device, self.base_model.conv1.weight[:10,0,0,0,0]))
+        # print("<--device: {} | after forward bn1.running_mean: {}-->\n".format(base_input.device, self.base_model.bn1.running_mean[:10]))
+        return out
+
+    def _shadow_branch(self, shadow_input):
+        """Cast the shadow network for this step and return a function that
+        runs the shadow branch (up to the classifier) on shadow_input.
+        """
+        if self.shadow_2d:
+            # fold time into batch: (B, C, T, H, W) -> (B*T, C, H, W)
+            b, c, t = shadow_input.shape[:3]
+            shadow_input = shadow_input.transpose(1, 2).reshape((b * t, c) + shadow_input.shape[3:])
+        if self.functional_shadow:
+            tensors = self._shadow_tensors()
+        else:
             # Cast Shadow
-            self._cast_shadow()
-            # Infer TSN
-            out_shadow = self.shadow_model(shadow_input)
+            if self.persistent_shadow:
+                self._bind_shadow()
+            else:
+                self._prepare_shadow_model()
+                self._cast_shadow()
+
+        def run():
+            if self.functional_shadow:
+                # Infer TSN with the collapsed weights passed in
+                out_shadow = functional_call(self.shadow_model, tensors, (shadow_input,))
+            else:
+                # Infer TSN
+                out_shadow = self.shadow_model(shadow_input)
+            if self.shadow_2d:
+                # unfold: (B*T, F) -> (B, F, T) as from the 3D shadow network
+                out_shadow = out_shadow.view(b, t, -1).transpose(1, 2)
             # Aggregate across segments
             out_2 = self._aggregate(out_shadow)
             out_2 = self.classifier(out_2)
             if not self.before_softmax:
                 out_2 = self.softmax(out_2)
-            return out, out_2
-        else:
-            return out
+            return out_2
+        return run
+
+    def forward(self, input):
+        base_input = input[:,:,:16,...]
+        if input.shape[2] <= 16:
+            return self._base_branch(base_input)
+        shadow_input = input[:,:,16:,...]
+        if self.concurrent_shadow:
+            # cast in this thread before the base branch starts: the worker
+            # only reads the collapsed weights and its own batchnorm copies.
+            # These hold the running statistics from before this step's base
+            # update (one step older than in the sequential order), which
+            # does not change the output since the shadow batchnorm always
+            # normalizes with batch statistics
+            run = self._shadow_branch(shadow_input)
+            future = shadow_executor(shadow_input.device, self.shadow_threads).submit(
+                _with_grad_mode, torch.is_grad_enabled(), run)
+            out = self._base_branch(base_input)
+            return out, future.result()
+        out = self._base_branch(base_input)
+        return out, self._shadow_branch(shadow_input)()
 
-    def get_augmentation(self):
+    def get_augmentation(self, tensor=False):
+        if tensor:
+            # same sampling, applied to a (T, C, H, W) clip from ClipToTensor
+            return torchvision.transforms.Compose([TensorMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
+                                                   TensorRandomHorizontalFlip()])
         return torchvision.transforms.Compose([GroupMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
                                                    GroupRandomHorizontalFlip()])
 
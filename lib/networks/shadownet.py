@@ -12,16 +12,20 @@ from ..op_wrapper import Linear as flexLinear
 
 class flexBottleneck(nn.Module):
     expansion = 4
+    # layer types of the whole network, see plainBottleneck
+    Conv3d = flexConv3d
+    BatchNorm3d = flexBatchNorm3d
+    Linear = flexLinear
 
     def __init__(self, inplanes, planes, stride=1, downsample=None):
         super(flexBottleneck, self).__init__()
-        self.conv1 = flexConv3d(inplanes, planes, kernel_size=1, bias=False)
-        self.bn1 = flexBatchNorm3d(planes)
-        self.conv2 = flexConv3d(planes, planes, kernel_size=(1,3,3), stride=(1,stride,stride),
-                                padding=(0,1,1), bias=False)
-        self.bn2 = flexBatchNorm3d(planes)
-        self.conv3 = flexConv3d(planes, planes * self.expansion, kernel_size=1, bias=False)
-        self.bn3 = flexBatchNorm3d(planes * self.expansion)
+        self.conv1 = self.Conv3d(inplanes, planes, kernel_size=1, bias=False)
+        self.bn1 = self.BatchNorm3d(planes)
+        self.conv2 = self.Conv3d(planes, planes, kernel_size=(1,3,3), stride=(1,stride,stride),
+                                 padding=(0,1,1), bias=False)
+        self.bn2 = self.BatchNorm3d(planes)
+        self.conv3 = self.Conv3d(planes, planes * self.expansion, kernel_size=1, bias=False)
+        self.bn3 = self.BatchNorm3d(planes * self.expansion)
         self.relu = nn.ReLU(inplace=True)
         self.downsample = downsample
         self.stride = stride
@@ -48,14 +52,21 @@ class flexBottleneck(nn.Module):
 
         return out
 
+class plainBottleneck(flexBottleneck):
+    """Stock nn layers, for running the network through lib.stateless
+    """
+    Conv3d = nn.Conv3d
+    BatchNorm3d = nn.BatchNorm3d
+    Linear = nn.Linear
+
 class ReShadowNet(nn.Module):
 
     def __init__(self, block, layers, num_classes=1000, feat=False):
         self.inplanes = 64
         super(ReShadowNet, self).__init__()
         self.feat = feat
-        self.conv1 = flexConv3d(3, 64, kernel_size=(1,7,7), stride=(1,2,2), padding=(0,3,3), bias=False)
-        self.bn1 = flexBatchNorm3d(64)
+        self.conv1 = block.Conv3d(3, 64, kernel_size=(1,7,7), stride=(1,2,2), padding=(0,3,3), bias=False)
+        self.bn1 = block.BatchNorm3d(64)
         self.relu = nn.ReLU(inplace=True)
         self.maxpool = nn.MaxPool3d(kernel_size=(1,3,3), stride=(1,2,2), padding=(0,1,1))
         self.layer1 = self._make_layer(block, 64, layers[0])
@@ -65,15 +76,15 @@ class ReShadowNet(nn.Module):
         self.avgpool = nn.AvgPool3d((1,7,7), stride=1)
         self.feat_dim = 512 * block.expansion
         if not feat:
-            self.fc = flexLinear(512 * block.expansion, num_classes)
+            self.fc = block.Linear(512 * block.expansion, num_classes)
 
     def _make_layer(self, block, planes, blocks, stride=1):
         downsample = None
         if stride != 1 or self.inplanes != planes * block.expansion:
             downsample = nn.Sequential(
-                flexConv3d(self.inplanes, planes * block.expansion,
-                        kernel_size=1, stride=stride, bias=False),
-                flexBatchNorm3d(planes * block.expansion),
+                block.Conv3d(self.inplanes, planes * block.expansion,
+                             kernel_size=1, stride=(1,stride,stride), bias=False),
+                block.BatchNorm3d(planes * block.expansion),
             )
 
         layers = []
@@ -102,10 +113,12 @@ class ReShadowNet(nn.Module):
 
         return x
 
-def resnet50_shadow(feat=False, **kwargs):
+def resnet50_shadow(feat=False, plain=False, **kwargs):
     """Constructs a ResNet-50 shadow model.
     Args:
         feat: if True, abandon pre-defined fc layer
+        plain: if True, build it from stock nn layers instead of FlexModules
     """
-    model = ReShadowNet(flexBottleneck, [3, 4, 6, 3], feat=feat, **kwargs)
+    block = plainBottleneck if plain else flexBottleneck
+    model = ReShadowNet(block, [3, 4, 6, 3], feat=feat, **kwargs)
     return model
\ No newline at end of file
@@ -1,5 +1,9 @@
 """
 Modify the original file to make the class support feature extraction
+
+2D version of shadownet.py: the sparse frames are folded into the batch,
+(B*T, C, H, W) in, (B*T, feat_dim) out, and the 3D kernels are collapsed
+to 4-D ones.
 """
 import torch
 import torch.nn as nn
@@ -12,16 +16,20 @@ from ..op_wrapper import Linear as flexLinear
 
 class flexBottleneck(nn.Module):
     expansion = 4
+    # layer types of the whole network, see plainBottleneck
+    Conv2d = flexConv2d
+    BatchNorm2d = flexBatchNorm2d
+    Linear = flexLinear
 
     def __init__(self, inplanes, planes, stride=1, downsample=None):
         super(flexBottleneck, self).__init__()
-        self.conv1 = flexConv2d(inplanes, planes, kernel_size=1, bias=False)
-        self.bn1 = flexBatchNorm2d(planes)
-        self.conv2 = flexConv2d(planes, planes, kernel_size=3, stride=stride,
-                                padding=1, bias=False)
-        self.bn2 = flexBatchNorm2d(planes)
-        self.conv3 = flexConv2d(planes, planes * self.expansion, kernel_size=1, bias=False)
-        self.bn3 = flexBatchNorm2d(planes * self.expansion)
+        self.conv1 = self.Conv2d(inplanes, planes, kernel_size=1, bias=False)
+        self.bn1 = self.BatchNorm2d(planes)
+        self.conv2 = self.Conv2d(planes, planes, kernel_size=3, stride=stride,
+                                 padding=1, bias=False)
+        self.bn2 = self.BatchNorm2d(planes)
+        self.conv3 = self.Conv2d(planes, planes * self.expansion, kernel_size=1, bias=False)
+        self.bn3 = self.BatchNorm2d(planes * self.expansion)
         self.relu = nn.ReLU(inplace=True)
         self.downsample = downsample
         self.stride = stride
@@ -48,32 +56,39 @@ class flexBottleneck(nn.Module):
 
         return out
 
+class plainBottleneck(flexBottleneck):
+    """Stock nn layers, for running the network through lib.stateless
+    """
+    Conv2d = nn.Conv2d
+    BatchNorm2d = nn.BatchNorm2d
+    Linear = nn.Linear
+
 class ReShadowNet2D(nn.Module):
 
     def __init__(self, block, layers, num_classes=1000, feat=False):
         self.inplanes = 64
         super(ReShadowNet2D, self).__init__()
         self.feat = feat
-        self.conv1 = flexConv3d(3, 64, kernel_size=(1,7,7), stride=(1,2,2), padding=(0,3,3), bias=False)
-        self.bn1 = flexBatchNorm3d(64)
+        self.conv1 = block.Conv2d(3, 64, kernel_size=7, stride=2, padding=3, bias=False)
+        self.bn1 = block.BatchNorm2d(64)
         self.relu = nn.ReLU(inplace=True)
-        self.maxpool = nn.MaxPool3d(kernel_size=(1,3,3), stride=(1,2,2), padding=(0,1,1))
+        self.maxpool = nn.MaxPool2d(kernel_size=3, stride=2, padding=1)
         self.layer1 = self._make_layer(block, 64, layers[0])
         self.layer2 = self._make_layer(block, 128, layers[1], stride=2)
         self.layer3 = self._make_layer(block, 256, layers[2], stride=2)
         self.layer4 = self._make_layer(block, 512, layers[3], stride=2)
-        self.avgpool = nn.AvgPool3d((1,7,7), stride=1)
+        self.avgpool = nn.AvgPool2d(7, stride=1)
         self.feat_dim = 512 * block.expansion
         if not feat:
-            self.fc = flexLinear(512 * block.expansion, num_classes)
+            self.fc = block.Linear(512 * block.expansion, num_classes)
 
     def _make_layer(self, block, planes, blocks, stride=1):
         downsample = None
         if stride != 1 or self.inplanes != planes * block.expansion:
             downsample = nn.Sequential(
-                flexConv3d(self.inplanes, planes * block.expansion,
-                        kernel_size=1, stride=stride, bias=False),
-                flexBatchNorm3d(planes * block.expansion),
+                block.Conv2d(self.inplanes, planes * block.expansion,
+                             kernel_size=1, stride=stride, bias=False),
+                block.BatchNorm2d(planes * block.expansion),
             )
 
         layers = []
@@ -102,10 +117,12 @@ class ReShadowNet2D(nn.Module):
 
         return x
 
-def resnet50_shadow(feat=False, **kwargs):
-    """Constructs a ResNet-50 shadow model.
+def resnet50_shadow_2d(feat=False, plain=False, **kwargs):
+    """Constructs a ResNet-50 2D shadow model.
     Args:
         feat: if True, abandon pre-defined fc layer
+        plain: if True, build it from stock nn layers instead of FlexModules
     """
-    model = ReShadowNet2D(flexBottleneck, [3, 4, 6, 3], feat=feat, **kwargs)
+    block = plainBottleneck if plain else flexBottleneck
+    model = ReShadowNet2D(block, [3, 4, 6, 3], feat=feat, **kwargs)
     return model
\ No newline at end of file
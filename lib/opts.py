@@ -26,6 +26,14 @@ parser.add_argument('val_list', type=str)
 # ========================= Model Configs ==========================
 parser.add_argument('--arch', '-a', type=str, default="resnet18")
 parser.add_argument('--shadow', action='store_true')
+parser.add_argument('--functional_shadow', action='store_true',
+                    help='run the shadow network as plain nn layers with the collapsed weights passed in')
+parser.add_argument('--shadow_3d', action='store_true',
+                    help='run the shadow frames through 3D layers instead of folding them into a 2D batch')
+parser.add_argument('--concurrent_shadow', action='store_true',
+                    help='run the shadow branch in a worker thread next to the base branch')
+parser.add_argument('--shadow_threads', default=0, type=int, metavar='N',
+                    help='intra-op threads of the shadow worker (0: torch default, OpenMP backend only)')
 parser.add_argument('--dropout', '--do', default=0.2, type=float,
                     metavar='DO', help='dropout ratio (default: 0.2)')
 parser.add_argument('--mode', type=str, default='3D', choices=['3D', 'TSN', '2D'])
@@ -64,8 +72,36 @@ parser.add_argument('-e', '--evaluate', dest='evaluate', action='store_true',
                     help='evaluate model on validation set')
 parser.add_argument('--start-epoch', default=0, type=int, metavar='N',
                     help='manual epoch number (useful on restarts)')
+parser.add_argument('--seed', default=0, type=int,
+                    help='seed of the per-epoch temporal sampling plan (default: 0)')
 parser.add_argument('--output_root', type=str, default="./output")
 parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--backend', type=str, default="image", choices=['image', 'packed', 'lmdb', 'video', 'memmap'],
+                    help='frame storage backend (default: image)')
+parser.add_argument('--data_root', type=str, default=None,
+                    help='frame root or database path (default: data/<dataset>/access)')
+parser.add_argument('--draft_decode', action='store_true',
+                    help='decode jpegs at reduced resolution when the transforms allow it')
+parser.add_argument('--decode_threads', default=0, type=int, metavar='N',
+                    help='threads per data loading worker decoding one clip (default: 0)')
+parser.add_argument('--uint8_loader', action='store_true',
+                    help='ship uint8 clips from the workers and normalize whole batches on the gpu')
+parser.add_argument('--tensor_aug', action='store_true',
+                    help='crop, scale and flip whole uint8 clip tensors instead of each PIL frame')
+parser.add_argument('--plan_transforms', action='store_true',
+                    help='fuse scale/crop/stack/normalize into one resize and one write per clip')
+parser.add_argument('--ring_slots', default=0, type=int, metavar='N',
+                    help='load batches through a ring of N shared-memory batch slots (default: 0, DataLoader)')
+parser.add_argument('--frame_cache_mb', default=0, type=int, metavar='MB',
+                    help='cache encoded frames in RAM shared by all workers (default: 0, off)')
+parser.add_argument('--frame_cache_min_frame_bytes', default=1024, type=int, metavar='B',
+                    help='smallest encoded frame the frame cache has table slots for (default: 1024)')
+parser.add_argument('--train_shards', type=str, default=None,
+                    help='stream training videos from tar shards in this directory (see lib/utils/build_tar_shards.py)')
+parser.add_argument('--readahead', default=0, type=int, metavar='N',
+                    help='warm the page cache for the frames of the next N training batches (default: 0, off)')
+parser.add_argument('--val_cache_dir', type=str, default=None,
+                    help='cache the preprocessed uint8 validation clips here (default: none)')
 
 args = parser.parse_args()
 if args.mode == "2D":
@@ -0,0 +1,86 @@
+"""
+Page-cache warming that follows the epoch plan.
+
+The frames every sample reads in an epoch are fixed by VideoDataSet.set_epoch,
+and the shuffled order is fixed when the sampler is iterated, so the files a
+batch will touch are known long before a worker opens them. ReadAheadSampler
+draws the order itself and a background thread asks the kernel
+(posix_fadvise WILLNEED) to start reading the byte ranges of the next
+`lookahead` samples while the current ones are decoded.
+"""
+import os
+import threading
+
+import torch
+import torch.utils.data as data
+
+__all__ = ['ReadAheadSampler', 'will_need']
+
+
+def will_need(ranges):
+    """Hint the kernel to read [(file, offset, length)] (length 0: to the end)
+    into the page cache without waiting for it.
+    """
+    for path, offset, length in ranges:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+
+class ReadAheadSampler(data.Sampler):
+    """Random permutation sampler (like shuffle=True) that warms the page cache
+    for the `lookahead` samples after the one the DataLoader just dispatched.
+    The dataset must provide byte_ranges(index) (VideoDataSet does).
+    Set the dataset's epoch before iterating, as usual.
+    """
+    def __init__(self, dataset, lookahead=256, shuffle=True):
+        self.dataset = dataset
+        self.lookahead = lookahead
+        self.shuffle = shuffle
+        self.enabled = hasattr(os, 'posix_fadvise')
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self.dataset)
+
+    def _warm(self, order, state):
+        hinted = 0
+        while True:
+            with self._cond:
+                while not state['stop'] and hinted >= min(state['pos'] + self.lookahead, len(order)):
+                    self._cond.wait()
+                if state['stop']:
+                    return
+                end = min(state['pos'] + self.lookahead, len(order))
+            # never hint samples the workers already have
+            hinted = max(hinted, state['pos'])
+            for index in order[hinted:end]:
+                will_need(self.dataset.byte_ranges(index))
+            hinted = end
+
+    def __iter__(self):
+        n = len(self.dataset)
+        order = torch.randperm(n).tolist() if self.shuffle else list(range(n))
+        if not self.enabled or self.lookahead <= 0:
+            for index in order:
+                yield index
+            return
+        state = {'pos': 0, 'stop': False}
+        thread = threading.Thread(target=self._warm, args=(order, state))
+        thread.daemon = True
+        thread.start()
+        try:
+            for pos, index in enumerate(order):
+                with self._cond:
+                    state['pos'] = pos
+                    self._cond.notify()
+                yield index
+        finally:
+            with self._cond:
+                state['stop'] = True
+                self._cond.notify()
@@ -0,0 +1,79 @@
+"""
+Vectorized temporal sampling: the frame indices of every sample of an epoch
+in one numpy array. Mirrors VideoDataSet.dense_sampler, _sample_indices,
+_get_val_indices and _get_test_indices row by row.
+"""
+import numpy as np
+
+__all__ = ['dense_sampler', 'plan_epoch', 'plan_width']
+
+
+def dense_sampler(num_frames, length, stride, rng):
+    """Vectorized VideoDataSet.dense_sampler.
+    :num_frames: (N,) array, may be fractional (segment durations)
+    :return: (N, length) float array of 1-based frame positions
+    """
+    num_frames = np.asarray(num_frames, dtype=np.float64)
+    strides = np.full(num_frames.shape, stride, dtype=np.int64)
+    if length > 1:
+        # too short for `stride`: largest smaller stride that fits, or 1
+        too_short = num_frames - (length - 1) * stride - 1 < 0
+        fit = np.floor((num_frames - 1) / (length - 1)).astype(np.int64)
+        strides = np.where(too_short, np.where(num_frames > length, fit, 1), strides)
+    average_duration = num_frames - (length - 1) * strides - 1
+    # randint(average_duration + 1) for the clips that fit
+    high = np.floor(average_duration + 1)
+    offsets = np.where(average_duration >= 0,
+                       np.floor(rng.random_sample(num_frames.shape) * np.maximum(high, 1)), 0)
+    return offsets[:, None] + np.arange(length)[None, :] * strides[:, None] + 1
+
+
+def plan_width(phase, style, t_length, num_segments):
+    if phase == "Train" and style == "UnevenDense":
+        return t_length + num_segments - 1
+    elif phase == "Val":
+        return t_length
+    return t_length * num_segments
+
+
+def plan_epoch(num_frames, phase, style, t_length, t_stride, num_segments, rng):
+    """Frame indices (not yet clamped to num_frames) of every sample.
+    :num_frames: (N,) int array
+    :return: (N, plan_width(...)) int64 array. For UnevenDense each row holds
+             the t_length dense frames followed by num_segments - 1 sparse frames.
+    """
+    num_frames = np.asarray(num_frames, dtype=np.int64)
+    num_videos = len(num_frames)
+    if phase == "Train":
+        average_duration = num_frames / float(num_segments)
+        seg_offsets = average_duration[:, None] * np.arange(num_segments)[None, :]
+        if style == "Dense":
+            samples = dense_sampler(np.repeat(average_duration, num_segments), t_length, t_stride, rng)
+            samples = samples.reshape(num_videos, num_segments, t_length) + seg_offsets[:, :, None]
+            frames = samples.reshape(num_videos, -1)
+        elif style == "UnevenDense":
+            dense = dense_sampler(num_frames, t_length, t_stride, rng)
+            # last segment whose start is not after the middle dense frame
+            dense_seg = (dense[:, t_length // 2][:, None] >= seg_offsets).sum(axis=1) - 1
+            sparse = dense_sampler(np.repeat(average_duration, num_segments), 1, 1, rng)
+            sparse = sparse.reshape(num_videos, num_segments) + seg_offsets
+            keep = np.arange(num_segments)[None, :] != dense_seg[:, None]
+            sparse = sparse[keep].reshape(num_videos, num_segments - 1)
+            frames = np.concatenate([dense, sparse], axis=1)
+        else:
+            raise ValueError("Unsupported style {}".format(style))
+    elif phase == "Val":
+        valid_offset_range = num_frames - (t_length - 1) * t_stride - 1
+        offsets = np.maximum(np.trunc(valid_offset_range / 2.0), 0)
+        frames = offsets[:, None] + np.arange(t_length)[None, :] * t_stride + 1
+    elif phase == "Test":
+        valid_offset_range = num_frames - (t_length - 1) * t_stride - 1
+        interval = valid_offset_range / float(max(num_segments - 1, 1))
+        offsets = np.trunc(np.arange(num_segments)[None, :] * interval[:, None])
+        offsets = np.minimum(offsets, valid_offset_range[:, None])
+        offsets = np.maximum(offsets, 0) + 1
+        frames = (offsets[:, :, None] + np.arange(t_length)[None, None, :]).reshape(num_videos, -1)
+    else:
+        raise TypeError("Unsuported phase {}".format(phase))
+    # int(ind) of the per-item samplers
+    return np.trunc(frames).astype(np.int64)
@@ -0,0 +1,51 @@
+"""
+Run a module as a pure function of its tensors, in the style of
+torch.func.functional_call, for networks whose weights are computed from
+another network (the shadow net borrows the collapsed 3D kernels).
+
+strip_state(module) removes every parameter and buffer of a plain nn module
+tree; functional_call(module, tensors, args) binds a {dotted name: tensor}
+dict as ordinary instance attributes for one call. Layers keep their stock
+forward and plain attribute lookup, and autograd flows from the output into
+whatever the bound tensors were computed from. Each module object is bound
+separately, so DataParallel replicas do not interfere.
+"""
+from collections import OrderedDict
+
+__all__ = ['strip_state', 'functional_call']
+
+
+def strip_state(module):
+    """Remove the parameters and buffers of `module` and its children.
+    Returns {dotted name: shape} of what was removed (None entries, e.g. a
+    disabled bias, are kept as None and not listed).
+    """
+    shapes = OrderedDict()
+    for prefix, m in module.named_modules():
+        for table in (m._parameters, m._buffers):
+            for name in list(table.keys()):
+                tensor = table.pop(name)
+                # plain attribute, so the module stays usable (and .cuda()
+                # or DataParallel have nothing to copy)
+                m.__dict__[name] = None
+                if tensor is not None:
+                    shapes[prefix + '.' + name if prefix else name] = tuple(tensor.shape)
+    return shapes
+
+
+def functional_call(module, tensors, args):
+    """module(*args) with `tensors` ({dotted name: tensor}) bound in place of
+    its stripped state; the attributes are reset to None afterwards.
+    """
+    modules = dict(module.named_modules())
+    bound = []
+    try:
+        for name, tensor in tensors.items():
+            module_name, _, attr = name.rpartition('.')
+            m = modules[module_name]
+            m.__dict__[attr] = tensor
+            bound.append((m, attr))
+        return module(*args)
+    finally:
+        for m, attr in bound:
+            m.__dict__[attr] = None
@@ -0,0 +1,201 @@
+"""
+Streaming counterpart of VideoDataSet for throughput-bound storage (network
+file systems, spinning disks): videos are read front to back from sequential
+tar shards written by lib/utils/build_tar_shards.py instead of one random
+read per frame.
+"""
+import os
+import json
+import random
+import tarfile
+import warnings
+
+import numpy as np
+import torch
+import torch.utils.data as data
+
+from .backends import decode_jpeg
+from .sampling import plan_epoch
+from .transforms import required_short_side
+
+__all__ = ['TarShardDataSet', 'read_shard_index', 'SHARD_INDEX', 'SHARD_TMPL']
+
+SHARD_INDEX = 'shards.txt'
+SHARD_TMPL = 'shard-{:06d}.tar'
+
+
+def read_shard_index(shard_root):
+    """[(shard path, number of videos)] from <shard_root>/shards.txt
+    """
+    shards = []
+    for line in open(os.path.join(shard_root, SHARD_INDEX)):
+        items = line.strip().split(' ')
+        if items == ['']:
+            continue
+        shards.append((os.path.join(shard_root, items[0]), int(items[1])))
+    return shards
+
+
+def _balance(shards, num_parts):
+    """Split [(shard path, number of videos)] into num_parts lists with close
+    video counts: largest shard first, each to the part with the fewest
+    videos so far (lowest part on ties, so every rank computes the same split;
+    shards of equal size keep their order).
+    """
+    parts = [[] for _ in range(num_parts)]
+    totals = [0] * num_parts
+    for shard in sorted(shards, key=lambda s: -s[1]):
+        i = totals.index(min(totals))
+        parts[i].append(shard)
+        totals[i] += shard[1]
+    return parts
+
+
+class TarShardDataSet(data.IterableDataset):
+    """Iterate (clip, label) over the videos of tar shards.
+
+    Shards are split by distributed rank, then by DataLoader worker, after a
+    per-epoch shuffle of the shard order (Train), balancing the number of
+    videos per split. In Train every worker then stops at the smallest count
+    of its split over all ranks, so all ranks yield the same number of
+    samples and batches (DataLoader batches per worker) and DDP does not wait
+    at the end of an epoch for a rank that has run out. Within a worker, samples go
+    through a bounded shuffle buffer that holds only the encoded frames each
+    sample needs; decoding and `transform` run when a sample leaves the buffer.
+    Frame indices come from sampling.plan_epoch, as in VideoDataSet.
+    """
+    def __init__(self, shard_root,
+                 t_length=32, t_stride=2, num_segments=1,
+                 transform=None, style="Dense",
+                 phase="Train", shuffle_buffer=256, seed=0,
+                 rank=None, world_size=None, draft_decode=False):
+        """
+        :shard_root: directory with shards.txt and the shards
+        :style: Dense, for 2D and 3D model, and UnevenDense for the shadow model
+        :phase: Train, Val, Test; only Train shuffles
+        :shuffle_buffer: number of buffered samples per worker (Train)
+        :rank, world_size: distributed split, default from torch.distributed
+        """
+        self.shard_root = shard_root
+        self.shards = read_shard_index(shard_root)
+        self.t_length = t_length
+        self.t_stride = t_stride
+        self.num_segments = num_segments
+        self.transform = transform
+        assert(style in ("Dense", "UnevenDense")), "Only support Dense and UnevenDense"
+        self.style = style
+        if phase not in ("Train", "Val", "Test"):
+            raise TypeError("Unsuported phase {}".format(phase))
+        self.phase = phase
+        self.shuffle_buffer = shuffle_buffer
+        self.seed = seed
+        if rank is None or world_size is None:
+            distributed = torch.distributed.is_available() and torch.distributed.is_initialized()
+            rank = torch.distributed.get_rank() if distributed else 0
+            world_size = torch.distributed.get_world_size() if distributed else 1
+        if len(self.shards) < world_size:
+            raise ValueError("{} shards for {} ranks, every rank needs at least one; rebuild the "
+                             "shards with a smaller --videos_per_shard".format(len(self.shards), world_size))
+        self.rank = rank
+        self.world_size = world_size
+        self.short_side = required_short_side(transform) if draft_decode and transform is not None else None
+        self.set_epoch(0)
+
+    def set_epoch(self, epoch):
+        """Shard order and frame sampling of `epoch`; call before iterating.
+        """
+        self.epoch = epoch
+
+    def _splits(self, num_workers=1):
+        """Shards of this epoch by [rank][worker]"""
+        order = list(range(len(self.shards)))
+        if self.phase == "Train":
+            random.Random(self.seed * 100003 + self.epoch).shuffle(order)
+        ranks = _balance([self.shards[i] for i in order], self.world_size)
+        return [_balance(shards, num_workers) for shards in ranks]
+
+    def _quota(self, splits, worker_id):
+        """Samples worker `worker_id` yields: all of its videos in Val/Test,
+        the smallest count of that worker's shards over all ranks in Train.
+        """
+        counts = [sum(n for _, n in workers[worker_id]) for workers in splits]
+        return counts[self.rank] if self.phase != "Train" else min(counts)
+
+    def __len__(self):
+        """Videos of this rank (an upper bound in Train, where each of the
+        DataLoader workers may cut a few more to stay even across ranks).
+        """
+        # with one worker, worker 0 holds the whole rank
+        return self._quota(self._splits(), 0)
+
+    def _videos(self, shards):
+        """Stream (meta, {frame idx: encoded bytes}) with only the frames the
+        sample of this epoch needs kept in memory.
+        """
+        rng = np.random.RandomState([self.seed, self.epoch, self.rank, self._worker_id])
+        for path, _ in shards:
+            meta, frames, wanted = None, None, None
+            # 'r|' reads the shard strictly sequentially
+            with tarfile.open(path, 'r|') as tar:
+                for member in tar:
+                    key, ext = member.name.split('.', 1)
+                    if ext == 'json':
+                        if meta is not None:
+                            yield meta, frames
+                        meta = json.loads(tar.extractfile(member).read().decode('utf-8'))
+                        meta['indices'] = plan_epoch(np.array([meta['num_frames']]), self.phase, self.style,
+                                                     self.t_length, self.t_stride, self.num_segments, rng)[0]
+                        wanted = set(min(int(i), meta['num_frames']) for i in meta['indices'])
+                        frames = {}
+                    else:
+                        idx = int(ext.split('.')[0])
+                        if idx in wanted:
+                            frames[idx] = tar.extractfile(member).read()
+                if meta is not None:
+                    yield meta, frames
+
+    def _build_sample(self, meta, frames):
+        # clamp indices that run past the end of the video to the last frame,
+        # decode every distinct frame once
+        indices = [min(int(i), meta['num_frames']) for i in meta['indices']]
+        images = dict((idx, decode_jpeg(frames[idx], self.short_side)) for idx in set(indices))
+        images = [images[idx] for idx in indices]
+        if self.transform is not None:
+            images = self.transform(images)
+        return images, meta['label']
+
+    def __iter__(self):
+        worker_info = data.get_worker_info()
+        self._worker_id = worker_info.id if worker_info is not None else 0
+        num_workers = worker_info.num_workers if worker_info is not None else 1
+        if len(self.shards) < self.world_size * num_workers and self._worker_id == 0:
+            warnings.warn("{} shards for {} ranks x {} workers: some workers get no shard and stay idle; "
+                          "rebuild the shards with a smaller --videos_per_shard".format(
+                              len(self.shards), self.world_size, num_workers))
+        splits = self._splits(num_workers)
+        shards = splits[self.rank][self._worker_id]
+        quota = self._quota(splits, self._worker_id)
+        if quota == 0:
+            return
+        for n, sample in enumerate(self._samples(shards), 1):
+            yield sample
+            if n == quota:
+                return
+
+    def _samples(self, shards):
+        if self.phase != "Train" or self.shuffle_buffer <= 1:
+            for meta, frames in self._videos(shards):
+                yield self._build_sample(meta, frames)
+            return
+        rng = random.Random(hash((self.seed, self.epoch, self.rank, self._worker_id)))
+        buffer = []
+        for item in self._videos(shards):
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(item)
+                continue
+            i = rng.randrange(len(buffer))
+            buffer[i], item = item, buffer[i]
+            yield self._build_sample(*item)
+        rng.shuffle(buffer)
+        for item in buffer:
+            yield self._build_sample(*item)
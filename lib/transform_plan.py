@@ -0,0 +1,176 @@
+"""
+Planner for composed Group* pipelines.
+
+    GroupScale(256) -> GroupCenterCrop(224) -> Stack -> ToTorchFormatTensor -> GroupNormalize
+
+resizes every full frame and then throws most of it away, and materializes
+a list or a tensor after every op. plan_transforms() works out, per clip,
+the final crop box in source coordinates, resizes only that region of each
+frame (one PIL resize with `box`), copies it straight into a preallocated
+uint8 clip buffer and does Stack + ToTensor + Normalize as one multiply-add
+into the output tensor.
+"""
+import random
+
+import numpy as np
+import torch
+from PIL import Image
+
+from .transforms import (GroupScale, GroupCenterCrop, GroupMultiScaleCrop, GroupRandomHorizontalFlip,
+                         IdentityTransform, Stack, ToTorchFormatTensor, GroupNormalize, ToNormalizedTensor,
+                         flatten_transforms)
+
+__all__ = ['plan_transforms', 'PlannedTransform']
+
+_GEOMETRY_OPS = (GroupScale, GroupCenterCrop, GroupMultiScaleCrop)
+
+
+def plan_transforms(transform):
+    """Return a fused PlannedTransform equivalent to `transform`, or
+    `transform` itself if it contains ops the planner does not know.
+    Supported: GroupScale, GroupCenterCrop, GroupMultiScaleCrop (at most one
+    of the two resizing ops, no crop after GroupMultiScaleCrop), then
+    GroupRandomHorizontalFlip, then Stack,
+    optionally followed by ToTorchFormatTensor/GroupNormalize or
+    ToNormalizedTensor.
+    """
+    ops = [op for op in flatten_transforms(transform) if not isinstance(op, IdentityTransform)]
+    stacks = [i for i, op in enumerate(ops) if isinstance(op, Stack)]
+    if len(stacks) != 1:
+        return transform
+    geometry, stack, post = ops[:stacks[0]], ops[stacks[0]], ops[stacks[0] + 1:]
+
+    # flips must come after every crop, and only one op may resample
+    flipped = False
+    for op in geometry:
+        if isinstance(op, GroupRandomHorizontalFlip):
+            flipped = True
+        elif not isinstance(op, _GEOMETRY_OPS) or flipped:
+            return transform
+    if sum(isinstance(op, (GroupScale, GroupMultiScaleCrop)) for op in geometry) > 1:
+        return transform
+    # a crop after GroupMultiScaleCrop would cut its resized output, which a
+    # single crop + resize of the source does not reproduce
+    crops = [i for i, op in enumerate(geometry) if isinstance(op, GroupMultiScaleCrop)]
+    if crops and any(isinstance(op, GroupCenterCrop) for op in geometry[crops[0]:]):
+        return transform
+
+    # fold the float conversion into one affine map per channel: x * scale + shift
+    scale, shift = None, None
+    if len(post) == 1 and isinstance(post[0], ToNormalizedTensor):
+        scale, shift = post[0].scale, post[0].shift
+    elif post:
+        if not isinstance(post[0], ToTorchFormatTensor) or not post[0].div:
+            return transform
+        if len(post) == 1:
+            scale, shift = torch.full((3,), 1 / 255.), torch.zeros(3)
+        elif len(post) == 2 and isinstance(post[1], GroupNormalize):
+            mean = torch.tensor(post[1].mean) * 255
+            std = torch.tensor(post[1].std) * 255
+            scale, shift = 1.0 / std, -mean / std
+        else:
+            return transform
+    return PlannedTransform(ops, geometry, stack.mode, scale, shift)
+
+
+class PlannedTransform(object):
+    """Fused form of a Compose, built by plan_transforms(). `transforms`
+    keeps the original ops, so flatten_transforms() and required_short_side()
+    see the same pipeline as before planning.
+    """
+    def __init__(self, transforms, geometry, mode, scale=None, shift=None):
+        self.transforms = transforms
+        self.geometry = geometry
+        self.mode = mode
+        self.scale = scale
+        self.shift = shift
+
+    def _plan_box(self, im_size):
+        """Walk the geometry ops on sizes only. Returns the source box
+        (x0, y0, x1, y1), the output size (w, h), whether a resample is
+        needed, whether the box must be cut out before resampling and whether
+        to flip; draws random numbers in the same order as the unplanned ops.
+        """
+        w, h = im_size
+        x0, y0, x1, y1 = 0., 0., float(w), float(h)
+        resample, crop_first, flip = False, False, False
+        for op in self.geometry:
+            if isinstance(op, GroupScale):
+                size = op.worker.size
+                if isinstance(size, int) or len(size) == 1:
+                    size = size if isinstance(size, int) else size[0]
+                    short, long = (w, h) if w <= h else (h, w)
+                    new_short, new_long = size, int(size * long / short)
+                    w, h = (new_short, new_long) if w <= h else (new_long, new_short)
+                else:
+                    h, w = size
+                resample = True
+            elif isinstance(op, GroupCenterCrop):
+                th, tw = op.worker.size
+                if th > h or tw > w:
+                    return None
+                i = int(round((h - th) / 2.))
+                j = int(round((w - tw) / 2.))
+                sx, sy = (x1 - x0) / w, (y1 - y0) / h
+                x0, y0, x1, y1 = x0 + j * sx, y0 + i * sy, x0 + (j + tw) * sx, y0 + (i + th) * sy
+                w, h = tw, th
+            elif isinstance(op, GroupMultiScaleCrop):
+                crop_w, crop_h, offset_w, offset_h = op._sample_crop_size((w, h))
+                sx, sy = (x1 - x0) / w, (y1 - y0) / h
+                x0, y0 = x0 + offset_w * sx, y0 + offset_h * sy
+                x1, y1 = x0 + crop_w * sx, y0 + crop_h * sy
+                w, h = op.input_size[0], op.input_size[1]
+                # GroupMultiScaleCrop crops before it resizes, so the filter must
+                # not see the pixels around the box (integer here: only crops
+                # come before it)
+                resample, crop_first = True, True
+            elif isinstance(op, GroupRandomHorizontalFlip):
+                if random.random() < 0.5:
+                    flip = not flip
+        return (x0, y0, x1, y1), (w, h), resample, crop_first, flip
+
+    def __call__(self, img_group):
+        assert(img_group[0].mode == 'RGB'), "Must read images in RGB mode."
+        state = random.getstate()
+        plan = self._plan_box(img_group[0].size)
+        if plan is None:
+            # e.g. a center crop larger than the frame (padding); replay the
+            # same random draws through the original ops
+            random.setstate(state)
+            for op in self.transforms:
+                img_group = op(img_group)
+            return img_group
+        box, (w, h), resample, crop_first, flip = plan
+        if crop_first:
+            crop_box = tuple(int(round(v)) for v in box)
+
+        clip = np.empty((len(img_group), h, w, 3), dtype=np.uint8)
+        for t, img in enumerate(img_group):
+            if crop_first:
+                img = img.crop(crop_box).resize((w, h), Image.BILINEAR)
+            elif resample:
+                img = img.resize((w, h), Image.BILINEAR, box=box)
+            elif img.size != (w, h):
+                img = img.crop(tuple(int(round(v)) for v in box))
+            img = np.asarray(img)
+            clip[t] = img[:, ::-1] if flip else img
+
+        # Stack layout as views of the (T, H, W, C) buffer, written once below
+        clip = torch.from_numpy(clip)
+        t = clip.shape[0]
+        if "3D" in self.mode:
+            src, shape = clip.permute(3, 0, 1, 2).unsqueeze(0), (3, t, h, w)
+        else:
+            src, shape = clip.permute(0, 3, 1, 2), (t * 3, h, w)
+        if self.scale is None:
+            out = torch.empty(shape, dtype=torch.uint8)
+            out.view(src.shape).copy_(src)
+        else:
+            out = torch.empty(shape, dtype=torch.float)
+            view = out.view(src.shape)
+            bshape = (1, -1) + (1,) * (src.dim() - 2)
+            torch.addcmul(self.shift.view(bshape), src, self.scale.view(bshape), out=view)
+        return out
+
+    def __repr__(self):
+        return "{}({})".format(self.__class__.__name__, ", ".join(op.__class__.__name__ for op in self.transforms))
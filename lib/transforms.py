@@ -34,13 +34,12 @@ class GroupNormalize(object):
         self.std = std
 
     def __call__(self, tensor):
-        rep_mean = self.mean * (tensor.size()[0]//len(self.mean))
-        rep_std = self.std * (tensor.size()[0]//len(self.std))
-
-        # TODO: make efficient
-        for t, m, s in zip(tensor, rep_mean, rep_std):
-            t.sub_(m).div_(s)
-            
+        # (C, T, H, W) from 3D Stack or (T*C, H, W) from 2D Stack: the channel
+        # pattern repeats every len(mean) rows of the first dim
+        view = tensor.view((-1, len(self.mean)) + tensor.shape[1:])
+        shape = (1, -1) + (1,) * (tensor.dim() - 1)
+        view.sub_(torch.tensor(self.mean, dtype=tensor.dtype).view(shape))
+        view.div_(torch.tensor(self.std, dtype=tensor.dtype).view(shape))
         return tensor
 
 
@@ -249,12 +248,103 @@ class ToTorchFormatTensor(object):
         return imgs.float().div(255) if self.div else img.float()
 
 
+class ToNormalizedTensor(object):
+    """Fused ToTorchFormatTensor + GroupNormalize for the uint8 output of
+    Stack, (C, T, H, W) in 3D mode or (T*C, H, W) in 2D mode. The clip is
+    converted into one float buffer (preallocated by the caller through
+    `out`, or allocated once here) and normalized there by a single
+    broadcasted multiply-add with constants derived from mean*255/std*255.
+    """
+    def __init__(self,
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225]):
+        mean = torch.tensor(mean) * 255
+        std = torch.tensor(std) * 255
+        # (x - mean) / std == x * scale + shift
+        self.scale = 1.0 / std
+        self.shift = -mean / std
+
+    def __call__(self, imgs, out=None):
+        assert(isinstance(imgs, torch.Tensor)), "pic must be torch.Tensor."
+        if out is None:
+            out = torch.empty(imgs.shape, dtype=torch.float, device=imgs.device)
+        out.copy_(imgs)
+        # channels repeat every 3 rows of the first dim in both layouts
+        view = out.view((-1, len(self.scale)) + out.shape[1:])
+        shape = (1, -1) + (1,) * (out.dim() - 1)
+        torch.addcmul(self.shift.view(shape), view, self.scale.view(shape), out=view)
+        return out
+
+
+class BatchNormalize(object):
+    """ToTorchFormatTensor + GroupNormalize for a whole collated uint8 batch
+    from Stack: (B, C, T, H, W) in 3D mode or (B, T*C, H, W) in 2D mode.
+    One broadcasted op on the batch with mean/std pre-scaled by 255.
+    """
+    def __init__(self,
+        mean=[0.485, 0.456, 0.406],
+        std=[0.229, 0.224, 0.225]):
+        self.mean = torch.tensor(mean) * 255
+        self.std = torch.tensor(std) * 255
+
+    def __call__(self, batch):
+        assert(batch.dim() in (4, 5)), "expect a (B, C, T, H, W) or (B, T*C, H, W) batch."
+        mean = self.mean.to(batch.device)
+        std = self.std.to(batch.device)
+        out = batch.float()
+        if batch.dim() == 5:
+            shape = (1, -1, 1, 1, 1)
+            view = out
+        else:
+            # frames are concatenated along channels
+            shape = (1, 1, -1, 1, 1)
+            view = out.view(out.shape[0], -1, len(mean), out.shape[2], out.shape[3])
+        view.sub_(mean.view(shape)).div_(std.view(shape))
+        return out
+
+
 class IdentityTransform(object):
 
     def __call__(self, data):
         return data
 
 
+def flatten_transforms(transform):
+    """List the ops of a (nested) torchvision Compose in call order.
+    """
+    if hasattr(transform, 'transforms'):
+        ops = []
+        for op in transform.transforms:
+            ops.extend(flatten_transforms(op))
+        return ops
+    return [transform]
+
+
+def required_short_side(transform):
+    """Smallest source short side that still covers what `transform` needs,
+    or None if it needs the frames at full resolution.
+    Looks at the first op that fixes the output scale.
+    """
+    from .tensor_transforms import (ClipToTensor, TensorRandomHorizontalFlip,
+                                    TensorScale, TensorMultiScaleCrop, TensorOverSample)
+    for op in flatten_transforms(transform):
+        if isinstance(op, (GroupRandomHorizontalFlip, IdentityTransform,
+                           ClipToTensor, TensorRandomHorizontalFlip)):
+            continue
+        elif isinstance(op, GroupScale):
+            size = op.worker.size
+            return size if isinstance(size, int) else min(size)
+        elif isinstance(op, TensorScale):
+            return op.size if isinstance(op.size, int) else min(op.size)
+        elif isinstance(op, (GroupOverSample, TensorOverSample)):
+            return None if op.scale_worker is None else required_short_side(op.scale_worker)
+        elif isinstance(op, (GroupMultiScaleCrop, TensorMultiScaleCrop)):
+            return int(math.ceil(max(op.input_size) / float(min(op.scales))))
+        else:
+            return None
+    return None
+
+
 if __name__ == "__main__":
     trans = torchvision.transforms.Compose([
         GroupMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
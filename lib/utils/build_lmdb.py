@@ -0,0 +1,67 @@
+"""
+Convert per-frame jpeg directories listed in one or more list files into a
+single LMDB database for the "lmdb" VideoDataSet backend.
+Videos are read by a pool of processes, LMDB only allows one writer so
+the main process commits the frames in batched transactions.
+
+python -m lib.utils.build_lmdb data/kinetics400/access data/kinetics400/lmdb \
+    data/kinetics400/kinetics_train_list.txt data/kinetics400/kinetics_val_list.txt \
+    --image_tmpl image_{:06d}.jpg --workers 16
+"""
+import os
+import argparse
+from multiprocessing import Pool
+
+import lmdb
+
+from lib.backends import lmdb_key
+
+parser = argparse.ArgumentParser(description="Build a LMDB frame database")
+parser.add_argument('src_root', type=str)
+parser.add_argument('dst_db', type=str)
+parser.add_argument('list_files', type=str, nargs='+')
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--map_size', type=float, default=2e12,
+                    help='maximum database size in bytes (default: 2TB)')
+parser.add_argument('--commit_every', type=int, default=200,
+                    help='videos per write transaction (default: 200)')
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def read_video(job):
+    src_root, image_tmpl, video, num_frames = job
+    frames = []
+    for idx in range(1, num_frames + 1):
+        with open(os.path.join(src_root, video, image_tmpl.format(idx)), 'rb') as f:
+            frames.append(f.read())
+    return video, frames
+
+
+def main():
+    args = parser.parse_args()
+    videos = dict()
+    for list_file in args.list_files:
+        for line in open(list_file):
+            items = line.strip().split(' ')
+            videos[items[0]] = int(items[1])
+    jobs = [(args.src_root, args.image_tmpl, video, num_frames) for video, num_frames in videos.items()]
+
+    env = lmdb.open(args.dst_db, map_size=int(args.map_size), subdir=True,
+                    readahead=False, meminit=False, map_async=True)
+    txn = env.begin(write=True)
+    with Pool(args.workers) as pool:
+        for i, (video, frames) in enumerate(pool.imap_unordered(read_video, jobs, chunksize=4)):
+            for idx, frame in enumerate(frames, 1):
+                txn.put(lmdb_key(video, idx), frame)
+            if (i + 1) % args.commit_every == 0:
+                txn.commit()
+                txn = env.begin(write=True)
+                print("{}/{} videos written".format(i + 1, len(jobs)))
+    txn.commit()
+    env.sync()
+    env.close()
+    print("done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Scan the frame directories of a list file in parallel and write a checked
+list file plus its binary index (<list_out>.index.npz, see lib/video_index.py)
+holding the true frame count of every video.
+
+An entry is broken if its directory is missing or empty, if its first or last
+frame cannot be read, or if its listed frame count differs from the frames on
+disk (counted from 1 up to the first missing one). Broken entries are dropped;
+with --repair a count mismatch is fixed instead. Dropped entries and the
+reason are written to <list_out>.dropped.txt.
+
+python -m lib.utils.build_manifest data/kinetics400/access \
+    data/kinetics400/kinetics_train_list.txt data/kinetics400/kinetics_train_list_checked.txt \
+    --image_tmpl image_{:06d}.jpg --repair --workers 32
+"""
+import os
+import argparse
+from multiprocessing import Pool
+
+from PIL import Image
+
+from lib.video_index import VideoIndex
+
+parser = argparse.ArgumentParser(description="Check a list file against the frames on disk")
+parser.add_argument('src_root', type=str)
+parser.add_argument('list_file', type=str)
+parser.add_argument('list_out', type=str)
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--repair', action='store_true',
+                    help='fix wrong frame counts instead of dropping the entry')
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def scan_video(job):
+    """(video, listed frames, label, usable frames on disk, problem or None)"""
+    src_root, image_tmpl, video, listed, label = job
+    directory = os.path.join(src_root, video)
+    if not os.path.isdir(directory):
+        return video, listed, label, 0, "missing directory"
+    names = set(os.listdir(directory))
+    num_frames = 0
+    while image_tmpl.format(num_frames + 1) in names:
+        num_frames += 1
+    if num_frames == 0:
+        return video, listed, label, 0, "no frames"
+    try:
+        Image.open(os.path.join(directory, image_tmpl.format(1))).verify()
+        Image.open(os.path.join(directory, image_tmpl.format(num_frames))).verify()
+    except Exception as e:
+        return video, listed, label, 0, "unreadable frame ({})".format(e)
+    if num_frames != listed:
+        return video, listed, label, num_frames, "{} frames listed, {} on disk".format(listed, num_frames)
+    return video, listed, label, num_frames, None
+
+
+def main():
+    args = parser.parse_args()
+    jobs = []
+    for line in open(args.list_file):
+        items = line.strip().split(' ')
+        if items == ['']:
+            continue
+        jobs.append((args.src_root, args.image_tmpl, items[0], int(items[1]), int(items[2])))
+
+    kept, dropped, repaired = [], [], 0
+    with Pool(args.workers) as pool:
+        for i, result in enumerate(pool.imap(scan_video, jobs, chunksize=16)):
+            video, listed, label, num_frames, problem = result
+            if problem is None:
+                kept.append((video, num_frames, label))
+            elif args.repair and num_frames > 0:
+                kept.append((video, num_frames, label))
+                repaired += 1
+            else:
+                dropped.append((video, problem))
+            if i % 10000 == 0:
+                print("{}/{} scanned".format(i, len(jobs)))
+
+    with open(args.list_out, 'w') as f:
+        for video, num_frames, label in kept:
+            f.write("{} {} {}\n".format(video, num_frames, label))
+    with open(args.list_out + '.dropped.txt', 'w') as f:
+        for video, problem in dropped:
+            f.write("{} {}\n".format(video, problem))
+    # parse the new list file once, so VideoDataSet finds its index
+    VideoIndex(args.list_out)
+    print("{} kept ({} repaired), {} dropped, see {}".format(
+          len(kept), repaired, len(dropped), args.list_out + '.dropped.txt'))
+
+
+if __name__ == "__main__":
+    main()
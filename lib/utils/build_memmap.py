@@ -0,0 +1,86 @@
+"""
+Decode every frame once, resize it to a fixed short side and store each
+video as a raw uint8 (num_frames, height, width, 3) array for the "memmap"
+VideoDataSet backend.
+
+python -m lib.utils.build_memmap data/kinetics400/access data/kinetics400/memmap_256 \
+    data/kinetics400/kinetics_train_list.txt data/kinetics400/kinetics_val_list.txt \
+    --short_side 256 --image_tmpl image_{:06d}.jpg --workers 16
+"""
+import os
+import argparse
+from multiprocessing import Pool
+
+import numpy as np
+from PIL import Image
+
+from lib.backends import load_rgb, read_memmap_index, write_memmap_index, MEMMAP_SUFFIX, MEMMAP_INDEX
+
+parser = argparse.ArgumentParser(description="Build a pre-resized uint8 frame cache")
+parser.add_argument('src_root', type=str)
+parser.add_argument('dst_root', type=str)
+parser.add_argument('list_files', type=str, nargs='+')
+parser.add_argument('--short_side', type=int, default=256)
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def resize_short_side(img, short_side):
+    w, h = img.size
+    if min(w, h) == short_side:
+        return img
+    if w < h:
+        size = (short_side, int(short_side * h / w))
+    else:
+        size = (int(short_side * w / h), short_side)
+    return img.resize(size, Image.BILINEAR)
+
+
+def convert_video(job):
+    src_root, dst_root, image_tmpl, short_side, video, num_frames = job
+    dst = os.path.join(dst_root, video) + MEMMAP_SUFFIX
+    frames = None
+    for idx in range(1, num_frames + 1):
+        img = load_rgb(os.path.join(src_root, video, image_tmpl.format(idx)), short_side)
+        img = resize_short_side(img, short_side)
+        if frames is None:
+            dst_dir = os.path.dirname(dst)
+            if not os.path.exists(dst_dir):
+                os.makedirs(dst_dir, exist_ok=True)
+            frames = np.memmap(dst + '.tmp', dtype=np.uint8, mode='w+',
+                               shape=(num_frames, img.size[1], img.size[0], 3))
+        frames[idx - 1] = np.asarray(img)
+    frames.flush()
+    shape = frames.shape[:3]
+    del frames
+    os.rename(dst + '.tmp', dst)
+    return video, shape
+
+
+def main():
+    args = parser.parse_args()
+    index = dict()
+    if os.path.exists(os.path.join(args.dst_root, MEMMAP_INDEX)):
+        index = read_memmap_index(args.dst_root)
+    else:
+        os.makedirs(args.dst_root, exist_ok=True)
+    videos = dict()
+    for list_file in args.list_files:
+        for line in open(list_file):
+            items = line.strip().split(' ')
+            if items[0] not in index:
+                videos[items[0]] = int(items[1])
+    jobs = [(args.src_root, args.dst_root, args.image_tmpl, args.short_side, video, num_frames)
+            for video, num_frames in videos.items()]
+    with Pool(args.workers) as pool:
+        for i, (video, shape) in enumerate(pool.imap_unordered(convert_video, jobs, chunksize=4)):
+            index[video] = shape
+            if (i + 1) % 1000 == 0:
+                print("{}/{} videos converted".format(i + 1, len(jobs)))
+                write_memmap_index(args.dst_root, index)
+    write_memmap_index(args.dst_root, index)
+    print("done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Convert per-frame jpeg directories into sequential tar shards for
+TarShardDataSet. Every video is stored contiguously as
+    <key>.json           {"video": ..., "num_frames": ..., "label": ...}
+    <key>.<idx:06d>.jpg  frame idx (1-based), in order
+and the videos are shuffled once across shards so a shard mixes classes.
+A `shards.txt` index (shard file, number of videos) is written to dst_root.
+
+python -m lib.utils.build_tar_shards data/kinetics400/access \
+    data/kinetics400/kinetics_train_list.txt data/kinetics400/shards_train \
+    --image_tmpl image_{:06d}.jpg --videos_per_shard 500 --workers 16
+"""
+import io
+import os
+import json
+import random
+import tarfile
+import argparse
+from multiprocessing import Pool
+
+from lib.tar_dataset import SHARD_INDEX, SHARD_TMPL
+
+parser = argparse.ArgumentParser(description="Write video frames into tar shards")
+parser.add_argument('src_root', type=str)
+parser.add_argument('list_file', type=str)
+parser.add_argument('dst_root', type=str)
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--videos_per_shard', default=500, type=int)
+parser.add_argument('--shuffle_seed', default=0, type=int,
+                    help='seed of the one-off shuffle of videos across shards (-1: keep list order)')
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def _add_member(tar, name, data):
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    tar.addfile(info, io.BytesIO(data))
+
+
+def write_shard(job):
+    src_root, dst, image_tmpl, videos = job
+    tmp = dst + '.tmp'
+    with tarfile.open(tmp, 'w') as tar:
+        for i, (video, num_frames, label) in enumerate(videos):
+            key = '{:08d}'.format(i)
+            meta = {"video": video, "num_frames": num_frames, "label": label}
+            _add_member(tar, key + '.json', json.dumps(meta).encode('utf-8'))
+            for idx in range(1, num_frames + 1):
+                with open(os.path.join(src_root, video, image_tmpl.format(idx)), 'rb') as f:
+                    _add_member(tar, '{}.{:06d}.jpg'.format(key, idx), f.read())
+    os.rename(tmp, dst)
+    return dst, len(videos)
+
+
+def main():
+    args = parser.parse_args()
+    videos = []
+    for line in open(args.list_file):
+        items = line.strip().split(' ')
+        if items == ['']:
+            continue
+        videos.append((items[0], int(items[1]), int(items[2])))
+    if args.shuffle_seed >= 0:
+        random.Random(args.shuffle_seed).shuffle(videos)
+    if not os.path.exists(args.dst_root):
+        os.makedirs(args.dst_root)
+
+    jobs = []
+    for s, start in enumerate(range(0, len(videos), args.videos_per_shard)):
+        dst = os.path.join(args.dst_root, SHARD_TMPL.format(s))
+        jobs.append((args.src_root, dst, args.image_tmpl, videos[start:start + args.videos_per_shard]))
+    shards = []
+    with Pool(args.workers) as pool:
+        for i, (dst, num_videos) in enumerate(pool.imap(write_shard, jobs)):
+            shards.append((os.path.basename(dst), num_videos))
+            print("{}/{} wrote {} ({} videos)".format(i + 1, len(jobs), dst, num_videos))
+    with open(os.path.join(args.dst_root, SHARD_INDEX), 'w') as f:
+        for name, num_videos in shards:
+            f.write("{} {}\n".format(name, num_videos))
+    print("done.")
+
+
+if __name__ == "__main__":
+    main()
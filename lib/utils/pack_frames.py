@@ -0,0 +1,53 @@
+"""
+Convert per-frame jpeg directories into one shard per video for the
+"packed" VideoDataSet backend.
+
+python -m lib.utils.pack_frames data/kinetics400/access \
+    data/kinetics400/kinetics_train_list.txt data/kinetics400/packed \
+    --image_tmpl image_{:06d}.jpg --workers 16
+"""
+import os
+import argparse
+from multiprocessing import Pool
+
+from lib.backends import write_pack, PACK_SUFFIX
+
+parser = argparse.ArgumentParser(description="Pack video frames into shards")
+parser.add_argument('src_root', type=str)
+parser.add_argument('list_file', type=str)
+parser.add_argument('dst_root', type=str)
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def pack_video(job):
+    src_root, dst_root, image_tmpl, video, num_frames = job
+    dst = os.path.join(dst_root, video) + PACK_SUFFIX
+    if os.path.exists(dst):
+        return video, 0
+    frames = []
+    for idx in range(1, num_frames + 1):
+        with open(os.path.join(src_root, video, image_tmpl.format(idx)), 'rb') as f:
+            frames.append(f.read())
+    dst_dir = os.path.dirname(dst)
+    if not os.path.exists(dst_dir):
+        os.makedirs(dst_dir, exist_ok=True)
+    write_pack(dst, frames)
+    return video, num_frames
+
+
+def main():
+    args = parser.parse_args()
+    jobs = []
+    for line in open(args.list_file):
+        items = line.strip().split(' ')
+        jobs.append((args.src_root, args.dst_root, args.image_tmpl, items[0], int(items[1])))
+    with Pool(args.workers) as pool:
+        for i, (video, num_frames) in enumerate(pool.imap_unordered(pack_video, jobs, chunksize=4)):
+            if i % 1000 == 0:
+                print("{}/{} packed {} ({} frames)".format(i, len(jobs), video, num_frames))
+    print("done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Array-backed index of a list file (video_path num_frames label per line).
+"""
+import os
+
+import numpy as np
+
+__all__ = ['VideoIndex']
+
+INDEX_SUFFIX = '.index.npz'
+
+
+class VideoIndex(object):
+    """Frame counts and labels as int arrays, paths as one utf-8 blob with
+    offsets. A handful of numpy arrays instead of one Python object per line,
+    so forked DataLoader workers do not touch (and copy) the index pages.
+    Items are built on access with `record_fn(path, num_frames, label)`.
+
+    The parsed arrays are cached next to the list file as <list_file>.index.npz
+    and reused while the list file keeps its size and mtime.
+    """
+    def __init__(self, list_file, record_fn=None):
+        self.list_file = list_file
+        self.record_fn = record_fn
+        stat = os.stat(list_file)
+        self._stamp = np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+        if not self._load(list_file + INDEX_SUFFIX):
+            self._parse(list_file)
+            try:
+                self.save(list_file + INDEX_SUFFIX)
+            except OSError:
+                pass
+
+    def _parse(self, list_file):
+        paths = []
+        num_frames = []
+        labels = []
+        for line in open(list_file):
+            items = line.strip().split(' ')
+            if items == ['']:
+                continue
+            paths.append(items[0].encode('utf-8'))
+            num_frames.append(int(items[1]))
+            labels.append(int(items[2]))
+        self.num_frames = np.array(num_frames, dtype=np.int32)
+        self.labels = np.array(labels, dtype=np.int32)
+        self.path_offsets = np.zeros(len(paths) + 1, dtype=np.int64)
+        self.path_offsets[1:] = np.cumsum([len(p) for p in paths])
+        self.path_blob = np.frombuffer(b''.join(paths), dtype=np.uint8)
+
+    def _load(self, index_file):
+        if not os.path.exists(index_file):
+            return False
+        with np.load(index_file) as f:
+            if not np.array_equal(f['stamp'], self._stamp):
+                return False
+            self.num_frames = f['num_frames']
+            self.labels = f['labels']
+            self.path_offsets = f['path_offsets']
+            self.path_blob = f['path_blob']
+        return True
+
+    def save(self, index_file):
+        np.savez(index_file, stamp=self._stamp, num_frames=self.num_frames, labels=self.labels,
+                 path_offsets=self.path_offsets, path_blob=self.path_blob)
+
+    def path(self, i):
+        return self.path_blob[self.path_offsets[i]:self.path_offsets[i + 1]].tobytes().decode('utf-8')
+
+    def __len__(self):
+        return len(self.num_frames)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("video index out of range")
+        item = (self.path(i), int(self.num_frames[i]), int(self.labels[i]))
+        return self.record_fn(*item) if self.record_fn is not None else item
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -11,8 +11,14 @@ import torch.backends.cudnn as cudnn
 import torch.optim
 
 from lib.dataset import VideoDataSet
+from lib.tar_dataset import TarShardDataSet
+from lib.loader import BatchTransformLoader, RingBufferLoader
+from lib.frame_cache import SharedFrameCache
+from lib.prefetch import ReadAheadSampler
 from lib.models import VideoModule
 from lib.transforms import *
+from lib.tensor_transforms import *
+from lib.transform_plan import plan_transforms
 from lib.utils.tools import *
 from lib.opts import args
 
@@ -37,6 +43,8 @@ def main():
 
     data_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
                              "data/{}/access".format(args.dataset))
+    if args.data_root is not None:
+        data_root = args.data_root
 
     # create model
     org_model = VideoModule(num_class=num_class, 
@@ -75,46 +83,108 @@ def main():
             print(("=> no checkpoint found at '{}'".format(args.resume)))
 
     # Data loading code
+    # with --uint8_loader the workers stop at Stack and whole batches are normalized
+    to_float = [] if args.uint8_loader else [ToNormalizedTensor()]
+    # one encoded-frame cache for all workers of both loaders
+    frame_cache = SharedFrameCache(args.frame_cache_mb << 20, args.frame_cache_min_frame_bytes) \
+                  if args.frame_cache_mb > 0 else None
     ## train data
-    train_transform = torchvision.transforms.Compose([
-        org_model.get_augmentation(),
-        Stack(mode=args.mode),
-        ToTorchFormatTensor(),
-        GroupNormalize(),
-        ])
-    train_dataset = VideoDataSet(root_path=data_root, 
-        list_file=args.train_list,
-        t_length=args.t_length, 
-        t_stride=args.t_stride, 
-        num_segments=args.num_segments,
-        image_tmpl=args.image_tmpl, 
-        transform=train_transform,
-        phase="Train")
-    train_loader = torch.utils.data.DataLoader(
-        train_dataset, 
-        batch_size=args.batch_size, shuffle=True, drop_last=True,
-        num_workers=args.workers, pin_memory=True)
+    if args.tensor_aug:
+        train_transform = torchvision.transforms.Compose([
+            ClipToTensor(),
+            org_model.get_augmentation(tensor=True),
+            TensorStack(mode=args.mode),
+            ] + to_float)
+    else:
+        train_transform = torchvision.transforms.Compose([
+            org_model.get_augmentation(),
+            Stack(mode=args.mode),
+            ] + to_float)
+    if args.plan_transforms:
+        train_transform = plan_transforms(train_transform)
+    if args.train_shards is not None:
+        # sequential tar shards, shuffled inside the dataset
+        train_dataset = TarShardDataSet(args.train_shards,
+            t_length=args.t_length,
+            t_stride=args.t_stride,
+            num_segments=args.num_segments,
+            draft_decode=args.draft_decode,
+            transform=train_transform,
+            seed=args.seed,
+            phase="Train")
+        train_loader = torch.utils.data.DataLoader(
+            train_dataset,
+            batch_size=args.batch_size, drop_last=True,
+            num_workers=args.workers, pin_memory=True)
+    else:
+        train_dataset = VideoDataSet(root_path=data_root, 
+            list_file=args.train_list,
+            t_length=args.t_length, 
+            t_stride=args.t_stride, 
+            num_segments=args.num_segments,
+            image_tmpl=args.image_tmpl, 
+            backend=args.backend,
+            draft_decode=args.draft_decode,
+            decode_threads=args.decode_threads,
+            transform=train_transform,
+            frame_cache=frame_cache,
+            seed=args.seed,
+            phase="Train")
+        if args.ring_slots > 0:
+            train_loader = RingBufferLoader(train_dataset,
+                batch_size=args.batch_size, shuffle=True, drop_last=True,
+                num_workers=args.workers, num_slots=args.ring_slots)
+        else:
+            # --readahead: the sampler warms the page cache for upcoming batches
+            train_sampler = None
+            if args.readahead > 0:
+                train_sampler = ReadAheadSampler(train_dataset, lookahead=args.readahead * args.batch_size)
+            train_loader = torch.utils.data.DataLoader(
+                train_dataset, 
+                batch_size=args.batch_size, shuffle=train_sampler is None, drop_last=True,
+                sampler=train_sampler, num_workers=args.workers, pin_memory=True)
 
     ## val data
-    val_transform = torchvision.transforms.Compose([
-        GroupScale(256),
-        GroupCenterCrop(224),
-        Stack(mode=args.mode),
-        ToTorchFormatTensor(),
-        GroupNormalize(),
-        ])
+    if args.tensor_aug:
+        val_transform = torchvision.transforms.Compose([
+            ClipToTensor(),
+            TensorScale(256),
+            TensorCenterCrop(224),
+            TensorStack(mode=args.mode),
+            ] + to_float)
+    else:
+        val_transform = torchvision.transforms.Compose([
+            GroupScale(256),
+            GroupCenterCrop(224),
+            Stack(mode=args.mode),
+            ] + to_float)
+    if args.plan_transforms:
+        val_transform = plan_transforms(val_transform)
     val_dataset = VideoDataSet(root_path=data_root, 
         list_file=args.val_list,
         t_length=args.t_length,
         t_stride=args.t_stride,
         num_segments=args.num_segments,
         image_tmpl=args.image_tmpl,
+        backend=args.backend,
+        draft_decode=args.draft_decode,
+        decode_threads=args.decode_threads,
         transform=val_transform,
+        frame_cache=frame_cache,
+        cache_dir=args.val_cache_dir,
         phase="Val")
-    val_loader = torch.utils.data.DataLoader(
-        val_dataset,
-        batch_size=args.batch_size, shuffle=False, 
-        num_workers=args.workers, pin_memory=True)
+    if args.ring_slots > 0:
+        val_loader = RingBufferLoader(val_dataset,
+            batch_size=args.batch_size, shuffle=False,
+            num_workers=args.workers, num_slots=args.ring_slots)
+    else:
+        val_loader = torch.utils.data.DataLoader(
+            val_dataset,
+            batch_size=args.batch_size, shuffle=False, 
+            num_workers=args.workers, pin_memory=True)
+    if args.uint8_loader:
+        train_loader = BatchTransformLoader(train_loader, BatchNormalize(), device='cuda')
+        val_loader = BatchTransformLoader(val_loader, BatchNormalize(), device='cuda')
 
     if args.mode != "3D":
         cudnn.benchmark = True
@@ -125,7 +195,15 @@ def main():
         adjust_learning_rate(optimizer, args.lr, epoch, args.lr_steps)
 
         # train for one epoch
+        train_dataset.set_epoch(epoch)
         train(train_loader, model, criterion, optimizer, epoch, args.print_freq)
+        if args.train_shards is None:
+            requested, decoded = train_dataset.decode_stats(reset=True)
+            logging.info("Epoch {} frames: {} requested, {} decoded, {} decodes saved".format(
+                         epoch, requested, decoded, requested - decoded))
+        if frame_cache is not None:
+            logging.info("Epoch {} frame cache: {hits} hits, {misses} misses, {evictions} evictions, "
+                         "{entries} frames in {bytes} bytes".format(epoch, **frame_cache.stats(reset=True)))
 
         # evaluate on validation set
         if (epoch + 1) % args.eval_freq == 0 or epoch == args.epochs - 1:
@@ -0,0 +1,65 @@
+"""
+Compare clip loading throughput (clips/s) of the VideoDataSet storage backends.
+
+python scripts/benchmark_backends.py data/kinetics400/kinetics_val_list.txt \
+    --root image=data/kinetics400/access packed=data/kinetics400/access \
+    lmdb=data/kinetics400/lmdb --workers 8
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import IdentityTransform
+
+parser = argparse.ArgumentParser(description="VideoDataSet backend benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--root', type=str, nargs='+', required=True,
+                    help='backend=root_path pairs to compare')
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('--num_clips', type=int, default=512)
+parser.add_argument('-j', '--workers', default=8, type=int)
+
+
+def count_clips(batch):
+    return len(batch)
+
+
+def run(backend, root_path, args):
+    dataset = VideoDataSet(root_path=root_path,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        transform=IdentityTransform(),
+        backend=backend,
+        phase="Train")
+    dataset.set_epoch(0)
+    indices = torch.randperm(len(dataset))[:args.num_clips].tolist()
+    loader = torch.utils.data.DataLoader(
+        torch.utils.data.Subset(dataset, indices),
+        batch_size=8, num_workers=args.workers, collate_fn=count_clips)
+    num_clips = 0
+    start = time.time()
+    for n in loader:
+        num_clips += n
+    elapsed = time.time() - start
+    print("{:>8s}: {} clips in {:.2f}s, {:.1f} clips/s".format(
+          backend, num_clips, elapsed, num_clips / elapsed))
+
+
+def main():
+    args = parser.parse_args()
+    for item in args.root:
+        backend, root_path = item.split('=', 1)
+        run(backend, root_path, args)
+
+
+if __name__ == "__main__":
+    main()
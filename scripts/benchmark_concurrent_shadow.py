@@ -0,0 +1,87 @@
+"""
+Latency of VideoShadowModule with the base and shadow branches run one after
+the other vs concurrently (concurrent_shadow=True: the shadow branch runs in
+a worker thread with its own intra-op threads). Reports a train step
+(forward, backward, SGD update) and an inference call (eval, no_grad) on
+main_shadow_test.py's VideoDebugDataSet, on the cpu.
+
+python scripts/benchmark_concurrent_shadow.py -b 2 --threads 32 --shadow_threads 8 --num_segments 4
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDebugDataSet
+from lib.models import VideoShadowModule
+
+parser = argparse.ArgumentParser(description="concurrent shadow branch benchmark")
+parser.add_argument('--arch', type=str, default="resnet50_3d")
+parser.add_argument('-b', '--batch-size', default=1, type=int)
+parser.add_argument('--num_segments', type=int, default=2,
+                    help='sparse frames after the 16 dense ones')
+parser.add_argument('--threads', type=int, default=os.cpu_count(),
+                    help='intra-op threads in total')
+parser.add_argument('--shadow_threads', type=int, default=0,
+                    help='of which the shadow worker gets (default: a quarter)')
+parser.add_argument('--num_steps', type=int, default=5)
+
+
+def timed(f, num_steps):
+    f()     # warm up
+    start = time.time()
+    for _ in range(num_steps):
+        f()
+    return (time.time() - start) / num_steps
+
+
+def run(args, concurrent, input, target):
+    shadow_threads = args.shadow_threads or max(1, args.threads // 4)
+    # the calling thread runs the base branch
+    torch.set_num_threads(max(1, args.threads - shadow_threads) if concurrent else args.threads)
+    torch.manual_seed(0)
+    model = VideoShadowModule(num_class=101, base_model_name=args.arch, dropout=0, pretrained=False,
+                              concurrent_shadow=concurrent, shadow_threads=shadow_threads)
+    criterion = torch.nn.CrossEntropyLoss()
+    optimizer = torch.optim.SGD(model.parameters(), 0.001, momentum=0.9)
+
+    def train_step():
+        output = model(input)
+        loss = sum(criterion(out, target) for out in output)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+
+    model.train()
+    step_time = timed(train_step, args.num_steps)
+    model.eval()
+    with torch.no_grad():
+        infer_time = timed(lambda: model(input), args.num_steps)
+    return step_time, infer_time
+
+
+def main():
+    args = parser.parse_args()
+    dataset = VideoDebugDataSet()
+    samples = [dataset[i] for i in range(args.batch_size)]
+    clips = torch.stack([s[0] for s in samples])
+    sparse = [16 + i % (clips.shape[2] - 16) for i in range(args.num_segments)]
+    input = clips[:, :, list(range(16)) + sparse]
+    target = torch.LongTensor([s[1] for s in samples])
+    print("input {}, {} threads".format(tuple(input.shape), args.threads))
+    results = {}
+    for concurrent in (False, True):
+        name = "concurrent" if concurrent else "sequential"
+        results[name] = run(args, concurrent, input, target)
+        print("{:>10s}: train step {:.1f} ms, inference {:.1f} ms".format(
+              name, results[name][0] * 1000, results[name][1] * 1000))
+    print("speedup: train step {:.2f}x, inference {:.2f}x".format(
+          results["sequential"][0] / results["concurrent"][0],
+          results["sequential"][1] / results["concurrent"][1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Per-clip jpeg decode time at full resolution vs reduced (draft) resolution.
+
+python scripts/benchmark_decode.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/access --phase Train
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import numpy as np
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import *
+
+parser = argparse.ArgumentParser(description="Reduced resolution decode benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--phase', type=str, default="Train", choices=['Train', 'Val'])
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('--num_clips', type=int, default=100)
+
+
+def build_transform(phase):
+    if phase == "Train":
+        return torchvision.transforms.Compose([
+            GroupMultiScaleCrop(input_size=224, scales=[1, .875, .75, .66]),
+            GroupRandomHorizontalFlip(),
+            Stack(mode="3D"),
+            ToTorchFormatTensor(),
+            GroupNormalize()])
+    return torchvision.transforms.Compose([
+        GroupScale(256),
+        GroupCenterCrop(224),
+        Stack(mode="3D"),
+        ToTorchFormatTensor(),
+        GroupNormalize()])
+
+
+def run(dataset, clips):
+    decode_time = 0.
+    total_time = 0.
+    for record, frames in clips:
+        start = time.time()
+        images = dataset._load_images(record.path, frames)
+        decode_time += time.time() - start
+        dataset.transform(images)
+        total_time += time.time() - start
+    return decode_time / len(clips), total_time / len(clips), images[0].size
+
+
+def main():
+    args = parser.parse_args()
+    transform = build_transform(args.phase)
+    datasets = [VideoDataSet(root_path=args.data_root,
+                    list_file=args.list_file,
+                    t_length=args.t_length,
+                    t_stride=args.t_stride,
+                    image_tmpl=args.image_tmpl,
+                    transform=transform,
+                    backend=args.backend,
+                    draft_decode=draft,
+                    phase=args.phase) for draft in (False, True)]
+    print("required short side: {}".format(datasets[1].backend.short_side))
+
+    # the same clips for both runs
+    random.seed(0)
+    np.random.seed(0)
+    clips = []
+    for index in np.random.permutation(len(datasets[0]))[:args.num_clips]:
+        record = datasets[0].video_list[index]
+        indices = datasets[0]._get_val_indices(record)['dense']
+        clips.append((record, [min(int(ind), record.num_frames) for ind in indices]))
+
+    # warm the page cache so only decode cost is compared
+    run(datasets[0], clips)
+    results = [run(dataset, clips) for dataset in datasets]
+    for name, (decode, total, size) in zip(("full", "draft"), results):
+        print("{:>6s}: decode {:.1f} ms/clip, decode+transform {:.1f} ms/clip, decoded size {}".format(
+              name, decode * 1000, total * 1000, size))
+    print("decode speedup: {:.2f}x".format(results[0][0] / results[1][0]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Per-sample latency of VideoDataSet.__getitem__ as the number of decode
+threads per worker grows.
+
+python scripts/benchmark_decode_threads.py data/ucf101/ucf101_train_split1_list.txt \
+    --data_root data/ucf101/access --t_length 32 --t_stride 2 --threads 0 2 4 8
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import *
+
+parser = argparse.ArgumentParser(description="Intra-sample decode thread benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--t_length', type=int, default=32)
+parser.add_argument('--t_stride', type=int, default=2)
+parser.add_argument('--num_samples', type=int, default=100)
+parser.add_argument('--threads', type=int, nargs='+', default=[0, 1, 2, 4, 8])
+
+
+def main():
+    args = parser.parse_args()
+    transform = torchvision.transforms.Compose([
+        GroupScale(256),
+        GroupCenterCrop(224),
+        Stack(mode="3D"),
+        ToTorchFormatTensor(),
+        GroupNormalize()])
+    samples = None
+    for num_threads in args.threads:
+        dataset = VideoDataSet(root_path=args.data_root,
+            list_file=args.list_file,
+            t_length=args.t_length,
+            t_stride=args.t_stride,
+            image_tmpl=args.image_tmpl,
+            transform=transform,
+            backend=args.backend,
+            decode_threads=num_threads,
+            phase="Val")
+        if samples is None:
+            samples = np.random.RandomState(0).permutation(len(dataset))[:args.num_samples]
+            # warm the page cache
+            for index in samples:
+                dataset[index]
+        latency = []
+        for index in samples:
+            start = time.time()
+            dataset[index]
+            latency.append(time.time() - start)
+        latency = np.array(latency) * 1000
+        print("threads {:>2d}: mean {:.1f} ms, p50 {:.1f} ms, p90 {:.1f} ms per sample".format(
+              num_threads, latency.mean(), np.percentile(latency, 50), np.percentile(latency, 90)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Fill and hit rate of lib.frame_cache.SharedFrameCache (--frame_cache_mb) with
+synthetic frames of a given size, and get/put rates. For every frame size:
+frames are put until the first eviction (the fill at that point must be at
+least --min_fill of the budget, i.e. the cache is limited by bytes and not
+by its hash table), then a set that fits in the budget is read twice (the
+second pass must hit every frame).
+
+python scripts/benchmark_frame_cache.py --capacity_mb 64 --frame_bytes 1024 4096 16384
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.frame_cache import SharedFrameCache
+
+parser = argparse.ArgumentParser(description="shared frame cache benchmark")
+parser.add_argument('--capacity_mb', type=int, default=16)
+parser.add_argument('--frame_bytes', type=int, nargs='+', default=[1024, 2048, 4096, 16384])
+parser.add_argument('--min_frame_bytes', type=int, default=1024,
+                    help='min_frame_bytes of the cache (--frame_cache_min_frame_bytes)')
+parser.add_argument('--min_fill', type=float, default=0.9)
+
+
+def main():
+    args = parser.parse_args()
+    for frame_bytes in args.frame_bytes:
+        buf = os.urandom(frame_bytes)
+        # fill until the first eviction
+        cache = SharedFrameCache(args.capacity_mb << 20, args.min_frame_bytes)
+        idx = 0
+        start = time.time()
+        while cache.stats()['evictions'] == 0:
+            cache.put('video', idx, buf)
+            idx += 1
+        put_rate = idx / (time.time() - start)
+        fill = cache.stats()['bytes'] / float(cache.capacity)
+
+        # a working set that fits: the second pass must not miss
+        cache = SharedFrameCache(args.capacity_mb << 20, args.min_frame_bytes)
+        num_frames = int(cache.capacity * 0.9) // (frame_bytes + 16)
+        for idx in range(num_frames):
+            if cache.get('video', idx) is None:
+                cache.put('video', idx, buf)
+        cache.stats(reset=True)
+        start = time.time()
+        for idx in range(num_frames):
+            frame = cache.get('video', idx)
+            assert(frame is None or frame == buf), "frame {} came back changed".format(idx)
+        get_rate = num_frames / (time.time() - start)
+        stats = cache.stats()
+        print("{:>6d} B frames: {:.1%} of {} MB filled at the first eviction, second pass {} hits {} misses, "
+              "{:.0f} puts/s, {:.0f} gets/s".format(frame_bytes, fill, args.capacity_mb,
+                                                     stats['hits'], stats['misses'], put_rate, get_rate))
+        assert(fill >= args.min_fill), "{} B frames only fill {:.1%} of the budget".format(frame_bytes, fill)
+        assert(stats['misses'] == 0), "{} B frames: a set that fits missed".format(frame_bytes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+10-crop test-time transform: GroupOverSample (10 PIL copies of every frame)
+vs TensorOverSample (one scaled clip tensor, crops as views, one batched
+flip; test.py --tensor_aug). Each variant runs in its own process and
+reports clips/s and the peak RSS growth over the decoded clips.
+
+python scripts/benchmark_oversample.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/access --num_segments 20 --t_length 8
+"""
+import os
+import sys
+import time
+import resource
+import argparse
+import multiprocessing
+
+import torch
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import *
+from lib.tensor_transforms import *
+
+parser = argparse.ArgumentParser(description="10-crop GroupOverSample benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--mode', type=str, default="3D")
+parser.add_argument('--t_length', type=int, default=8)
+parser.add_argument('--t_stride', type=int, default=8)
+parser.add_argument('--num_segments', type=int, default=20)
+parser.add_argument('--num_clips', type=int, default=10)
+
+
+def run(args, tensor):
+    torch.set_num_threads(1)    # one data loading worker
+    dataset = VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        num_segments=args.num_segments,
+        image_tmpl=args.image_tmpl,
+        backend=args.backend,
+        phase="Test")
+    if tensor:
+        transform = torchvision.transforms.Compose([
+            ClipToTensor(), TensorOverSample(224, 256), TensorStack(mode=args.mode), ToNormalizedTensor()])
+    else:
+        transform = torchvision.transforms.Compose([
+            GroupOverSample(224, 256), Stack(mode=args.mode), ToNormalizedTensor()])
+    clips = []
+    for index in range(min(args.num_clips, len(dataset))):
+        record = dataset.video_list[index]
+        clips.append(dataset._load_images(record.path, dataset._plan_indices(index)["dense"]))
+    # ru_maxrss is in KB on linux
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    for clip in clips:
+        out = transform(clip)
+        del out
+    elapsed = time.time() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print("{:>16s}: {:.2f} clips/s, {} frames per clip, peak RSS +{:.0f} MB".format(
+          "TensorOverSample" if tensor else "GroupOverSample", len(clips) / elapsed,
+          len(clips[0]), (peak - base) / 1024.))
+
+
+def main():
+    args = parser.parse_args()
+    for tensor in (False, True):
+        p = multiprocessing.Process(target=run, args=(args, tensor))
+        p.start()
+        p.join()
+
+
+if __name__ == "__main__":
+    main()
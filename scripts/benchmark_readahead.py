@@ -0,0 +1,89 @@
+"""
+data_time of a training loop on a cold page cache, with and without the
+plan-driven read-ahead of lib/prefetch.py (--readahead). Before each run the
+frames of the epoch are dropped from the page cache (POSIX_FADV_DONTNEED, no
+root needed); --step_time stands in for the forward/backward pass.
+
+python scripts/benchmark_readahead.py data/kinetics400/kinetics_train_list.txt \
+    --data_root data/kinetics400/access -b 32 -j 8 --readahead 8 --step_time 0.3
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.prefetch import ReadAheadSampler
+from lib.transforms import *
+
+parser = argparse.ArgumentParser(description="page cache read-ahead benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('-b', '--batch-size', default=32, type=int)
+parser.add_argument('-j', '--workers', default=8, type=int)
+parser.add_argument('--readahead', type=int, default=8, help='batches ahead')
+parser.add_argument('--step_time', type=float, default=0.3, help='seconds of simulated compute per batch')
+parser.add_argument('--num_batches', type=int, default=30)
+
+
+def drop_cache(dataset):
+    for index in range(len(dataset)):
+        for path, offset, length in dataset.byte_ranges(index):
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+def run(args, dataset, readahead):
+    drop_cache(dataset)
+    sampler = ReadAheadSampler(dataset, lookahead=readahead * args.batch_size) if readahead > 0 else None
+    loader = torch.utils.data.DataLoader(dataset, batch_size=args.batch_size, shuffle=sampler is None,
+                                         sampler=sampler, drop_last=True, num_workers=args.workers)
+    data_time = []
+    end = time.time()
+    for i, (input, target) in enumerate(loader):
+        data_time.append(time.time() - end)
+        if i == args.num_batches:
+            break
+        time.sleep(args.step_time)
+        end = time.time()
+    # the first batch includes worker start-up
+    data_time = data_time[1:]
+    print("readahead {:>3d} batches: data_time {:.3f}s avg, {:.3f}s max".format(
+          readahead, sum(data_time) / len(data_time), max(data_time)))
+
+
+def main():
+    args = parser.parse_args()
+    transform = torchvision.transforms.Compose([
+        GroupMultiScaleCrop(224, [1, .875, .75, .66]),
+        GroupRandomHorizontalFlip(),
+        Stack(mode="3D"),
+        ToNormalizedTensor(),
+        ])
+    dataset = VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        transform=transform,
+        backend=args.backend,
+        phase="Train")
+    # the evicted and hinted ranges follow the epoch plan, read it in the loader too
+    dataset.set_epoch(0)
+    run(args, dataset, 0)
+    run(args, dataset, args.readahead)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Batch transport of the default DataLoader (per-sample shared memory +
+default_collate) vs lib.loader.RingBufferLoader (workers write into
+preallocated shared-memory batch slots).
+
+python scripts/benchmark_ring_loader.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/memmap_256 --backend memmap -b 64 -j 16
+python scripts/benchmark_ring_loader.py --synthetic -b 64 -j 8     # transport only
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+import torch.utils.data as data
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.loader import RingBufferLoader
+from lib.transforms import *
+
+parser = argparse.ArgumentParser(description="ring buffer loader benchmark")
+parser.add_argument('list_file', type=str, nargs='?')
+parser.add_argument('--data_root', type=str, default=None)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--mode', type=str, default="3D")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('--synthetic', action='store_true',
+                    help='constant clips, to time the transport alone')
+parser.add_argument('--num_samples', type=int, default=2048)
+parser.add_argument('-b', '--batch-size', default=64, type=int)
+parser.add_argument('-j', '--workers', default=8, type=int)
+parser.add_argument('--num_batches', type=int, default=20)
+
+
+class SyntheticClips(data.Dataset):
+    """Fixed float clips of the training shape, built without decoding."""
+    def __init__(self, num_samples, t_length):
+        self.num_samples = num_samples
+        self.clip = torch.rand(3, t_length, 224, 224)
+
+    def __getitem__(self, index):
+        return self.clip.clone(), index % 400
+
+    def __len__(self):
+        return self.num_samples
+
+
+def build_dataset(args):
+    if args.synthetic:
+        return SyntheticClips(args.num_samples, args.t_length)
+    transform = torchvision.transforms.Compose([
+        GroupScale(256),
+        GroupCenterCrop(224),
+        Stack(mode=args.mode),
+        ToNormalizedTensor(),
+        ])
+    return VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        transform=transform,
+        backend=args.backend,
+        phase="Val")
+
+
+def run(name, loader, num_batches):
+    num_clips = 0
+    start = None
+    for i, (input, target) in enumerate(loader):
+        # touch the batch like the training loop's copy to the gpu would
+        input.sum()
+        # the first batch includes worker start-up
+        if i == 0:
+            start = time.time()
+            continue
+        num_clips += input.shape[0]
+        if i == num_batches:
+            break
+    elapsed = time.time() - start
+    print("{:>10s}: {:.1f} clips/s".format(name, num_clips / elapsed))
+
+
+def main():
+    args = parser.parse_args()
+    dataset = build_dataset(args)
+    loader = data.DataLoader(dataset, batch_size=args.batch_size, shuffle=False,
+                             drop_last=True, num_workers=args.workers)
+    run("DataLoader", loader, args.num_batches)
+    loader = RingBufferLoader(dataset, batch_size=args.batch_size, shuffle=False,
+                              drop_last=True, num_workers=args.workers)
+    run("ring", loader, args.num_batches)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Per-step cost of the shadow network in VideoShadowModule: rebuilding and
+recasting it in every forward (persistent_shadow=False), building it once
+and only rebinding the collapsed base weights (persistent_shadow=True), and
+running a stateless plain-nn copy with the weights passed in
+(functional_shadow=True), the last two with and without the collapsed kernel
+cache (cache_kernels) and with the shadow frames run by 3D layers or folded
+into the batch of the 2D shadow network (shadow_2d). Reports the shadow setup alone (after a weight update
+in train mode, with frozen weights in eval mode), the shadow branch (setup
+and shadow forward), a whole train step (forward, backward, SGD update) and
+a validation forward on main_shadow_test.py's VideoDebugDataSet, whose
+2 sparse frames are repeated for other --num_segments.
+
+python scripts/benchmark_shadow_step.py --arch resnet50_3d -b 8 --cuda
+python scripts/benchmark_shadow_step.py -b 1 --num_segments 2 4 8 --variants persistent-3d persistent
+
+--check instead compares every variant with the rebuild path, in train and
+eval mode, and fails if they disagree (outputs and base gradients must be
+bit-identical with 3D shadow layers; the 2D ones sum in another order),
+and loads checkpoints across the variants with strict=True: current ones,
+ones without metadata and old ones that still hold shadow_model.* copies.
+"""
+import os
+import sys
+import time
+import argparse
+from collections import OrderedDict
+
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDebugDataSet
+from lib.models import VideoShadowModule
+from lib.stateless import functional_call
+
+parser = argparse.ArgumentParser(description="shadow network per-step benchmark")
+parser.add_argument('--arch', type=str, default="resnet50_3d")
+parser.add_argument('-b', '--batch-size', default=2, type=int)
+parser.add_argument('--num_steps', type=int, default=5)
+parser.add_argument('--num_segments', type=int, nargs='+', default=[2],
+                    help='sparse frames after the 16 dense ones')
+parser.add_argument('--variants', type=str, nargs='+', default=None,
+                    help='subset of the variants to run (default: all)')
+parser.add_argument('--check', action='store_true',
+                    help='check the variants against the rebuild path instead of timing them')
+parser.add_argument('--cuda', action='store_true')
+
+
+def sync(args):
+    if args.cuda:
+        torch.cuda.synchronize()
+
+
+VARIANTS = [("rebuild", dict(persistent_shadow=False)),
+            ("persistent-3d", dict(persistent_shadow=True, shadow_2d=False)),
+            ("persistent-nocache", dict(persistent_shadow=True, cache_kernels=False)),
+            ("persistent", dict(persistent_shadow=True)),
+            ("functional-3d", dict(functional_shadow=True, shadow_2d=False)),
+            ("functional-nocache", dict(functional_shadow=True, cache_kernels=False)),
+            ("functional", dict(functional_shadow=True))]
+
+
+def run(args, kwargs, batch):
+    torch.manual_seed(0)
+    model = VideoShadowModule(num_class=101, base_model_name=args.arch, dropout=0,
+                              pretrained=False, **kwargs)
+    criterion = torch.nn.CrossEntropyLoss()
+    if args.cuda:
+        model, criterion = model.cuda(), criterion.cuda()
+    model.train()
+    optimizer = torch.optim.SGD(model.parameters(), 0.001, momentum=0.9)
+    input, target = batch
+
+    def setup():
+        if model.functional_shadow:
+            return model._shadow_tensors()
+        elif model.persistent_shadow:
+            model._bind_shadow()
+        else:
+            model._prepare_shadow_model()
+            if args.cuda:
+                model.shadow_model.cuda()
+            model._cast_shadow()
+
+    shadow_input = input[:,:,16:,...]
+    if model.shadow_2d:
+        b, c, t = shadow_input.shape[:3]
+        shadow_input = shadow_input.transpose(1, 2).reshape((b * t, c) + shadow_input.shape[3:])
+
+    def shadow_branch():
+        tensors = setup()
+        if model.functional_shadow:
+            return functional_call(model.shadow_model, tensors, (shadow_input,))
+        return model.shadow_model(shadow_input)
+
+    def update():
+        # what an optimizer step does to the kernel cache
+        with torch.no_grad():
+            for param in model.base_model.parameters():
+                param.add_(0)
+
+    def timed(f, before=None):
+        total = 0
+        for i in range(args.num_steps + 1):
+            if before is not None:
+                before()
+            sync(args)
+            start = time.time()
+            f()
+            sync(args)
+            if i > 0:   # the first call warms up
+                total += time.time() - start
+        return total / args.num_steps
+
+    setup_time = timed(setup, update)
+    branch_time = timed(shadow_branch, update)
+
+    step_time = 0
+    for i in range(args.num_steps + 1):
+        sync(args)
+        start = time.time()
+        output = model(input)
+        loss = sum(criterion(out, target) for out in output)
+        optimizer.zero_grad()
+        loss.backward()
+        optimizer.step()
+        sync(args)
+        if i > 0:   # the first step warms up
+            step_time += time.time() - start
+
+    model.eval()
+    with torch.no_grad():
+        val_setup_time = timed(setup)
+        val_time = timed(lambda: model(input))
+    return setup_time, branch_time, step_time / args.num_steps, val_setup_time, val_time
+
+
+def check(args, variant, kwargs, input, target):
+    models = []
+    for kw in (VARIANTS[0][1], kwargs):
+        torch.manual_seed(0)
+        model = VideoShadowModule(num_class=101, base_model_name=args.arch, dropout=0,
+                                  pretrained=False, **kw)
+        if args.cuda:
+            model = model.cuda()
+        models.append(model)
+    reference, model = models
+    model.load_state_dict(reference.state_dict())
+    exact = not model.shadow_2d
+    for mode in ("train", "eval"):
+        outputs, grads = [], []
+        for m in models:
+            m.train(mode == "train")
+            m.zero_grad()
+            output = m(input)
+            if mode == "train":
+                sum(out.sum() for out in output).backward()
+                grads.append([p.grad for p in m.parameters()])
+            outputs.append(output)
+        diff = max((a - b).abs().max().item() for a, b in zip(*outputs))
+        scale = max(out.abs().max().item() for out in outputs[0])
+        assert(diff == 0 if exact else diff <= 1e-3 * (1 + scale)), \
+            "{} {}: outputs differ by {} (scale {})".format(variant, mode, diff, scale)
+        if mode == "train" and exact:
+            for a, b in zip(*grads):
+                assert(a is None and b is None or torch.equal(a, b)), "{}: gradients differ".format(variant)
+        print("{:>18s} {}: max output difference {:.3g}".format(variant, mode, diff))
+    check_state_dict(variant, reference, model)
+
+
+def check_state_dict(variant, reference, model):
+    state = reference.state_dict()
+    # old checkpoints saved the shadow batchnorm copies of the base buffers
+    old = OrderedDict(state)
+    old._metadata = state._metadata
+    for name, buffer in reference.base_model.named_buffers():
+        old['shadow_model.' + name] = buffer.clone()
+    checkpoints = [("current", state), ("no metadata", OrderedDict(state.items())), ("old", old),
+                   ("back", model.state_dict())]
+    for name, checkpoint in checkpoints:
+        target = reference if name == "back" else model
+        target.load_state_dict(checkpoint, strict=True)
+        assert(set(target.state_dict()) == set(state)), "{} {} checkpoint: keys differ".format(variant, name)
+    for a, b in zip(reference.state_dict().values(), model.state_dict().values()):
+        assert(torch.equal(a, b)), "{}: checkpoint round trip changed the weights".format(variant)
+    print("{:>18s}: checkpoints load strictly ({} keys)".format(variant, len(state)))
+
+
+def main():
+    args = parser.parse_args()
+    dataset = VideoDebugDataSet()
+    samples = [dataset[i] for i in range(args.batch_size)]
+    clips = torch.stack([s[0] for s in samples])
+    target = torch.LongTensor([s[1] for s in samples])
+    for num_segments in args.num_segments:
+        sparse = [16 + i % (clips.shape[2] - 16) for i in range(num_segments)]
+        input = clips[:, :, list(range(16)) + sparse]
+        if args.cuda:
+            input, target = input.cuda(), target.cuda()
+        print("input {}".format(tuple(input.shape)))
+        for variant, kwargs in VARIANTS:
+            if args.variants is not None and variant not in args.variants:
+                continue
+            if args.check:
+                if variant != "rebuild":
+                    check(args, variant, kwargs, input, target)
+                continue
+            times = run(args, kwargs, (input, target))
+            print("{:>18s}: train: shadow setup {:.2f} ms, shadow branch {:.1f} ms, step {:.1f} ms | "
+                  "val: shadow setup {:.2f} ms, forward {:.1f} ms".format(variant, *[t * 1000 for t in times]))
+
+
+if __name__ == "__main__":
+    main()
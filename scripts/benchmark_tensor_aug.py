@@ -0,0 +1,78 @@
+"""
+Clip augmentation throughput of the per-frame PIL transforms vs the
+tensor versions in lib/tensor_transforms.py (--tensor_aug), on the same
+decoded clips and the same random crops. Fails if the two paths differ by
+more than --max_diff grey levels.
+
+python scripts/benchmark_tensor_aug.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/access --num_clips 50
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import torch
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import *
+from lib.tensor_transforms import *
+
+parser = argparse.ArgumentParser(description="PIL vs tensor clip augmentation benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--mode', type=str, default="3D")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('--num_clips', type=int, default=50)
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--max_diff', type=int, default=2,
+                    help="largest allowed difference between the two paths, in grey levels")
+
+
+def bench(name, transform, clips, repeat):
+    out = []
+    start = time.time()
+    for r in range(repeat):
+        random.seed(r)
+        out = [transform(clip) for clip in clips]
+    elapsed = time.time() - start
+    print("{:>16s}: {:.1f} clips/s".format(name, len(clips) * repeat / elapsed))
+    return out
+
+
+def main():
+    args = parser.parse_args()
+    torch.set_num_threads(1)    # one data loading worker
+    dataset = VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        backend=args.backend,
+        phase="Val")
+    clips = []
+    for index in range(min(args.num_clips, len(dataset))):
+        record = dataset.video_list[index]
+        clips.append(dataset._load_images(record.path, dataset._plan_indices(index)["dense"]))
+
+    train = [(GroupMultiScaleCrop(224, [1, .875, .75, .66]), GroupRandomHorizontalFlip(), Stack(mode=args.mode)),
+             (ClipToTensor(), TensorMultiScaleCrop(224, [1, .875, .75, .66]), TensorRandomHorizontalFlip(),
+              TensorStack(mode=args.mode))]
+    val = [(GroupScale(256), GroupCenterCrop(224), Stack(mode=args.mode)),
+           (ClipToTensor(), TensorScale(256), TensorCenterCrop(224), TensorStack(mode=args.mode))]
+    for phase, (pil, tensor) in [("train", train), ("val", val)]:
+        a = bench(phase + " pil", torchvision.transforms.Compose(pil), clips, args.repeat)
+        b = bench(phase + " tensor", torchvision.transforms.Compose(tensor), clips, args.repeat)
+        diff = max((x.float() - y.float()).abs().max().item() for x, y in zip(a, b))
+        print("{:>16s}: max abs diff {:.0f} / 255".format(phase, diff))
+        assert(diff <= args.max_diff), "{} outputs differ by {:.0f} grey levels".format(phase, diff)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Per-clip time of the composed Group* pipelines vs the same pipelines fused
+by lib.transform_plan.plan_transforms (--plan_transforms), on the same
+decoded clips and the same random crops. Fails if the planned output
+differs by more than --max_diff grey levels (after normalization: that many
+steps of the smallest channel std).
+
+python scripts/benchmark_transform_plan.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/access --num_clips 50
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+import torch
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.transforms import *
+from lib.transform_plan import plan_transforms
+
+parser = argparse.ArgumentParser(description="planned vs unplanned transform benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--mode', type=str, default="3D")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('--num_clips', type=int, default=50)
+parser.add_argument('--repeat', type=int, default=3)
+parser.add_argument('--max_diff', type=float, default=1,
+                    help="largest allowed difference from the unplanned pipeline, in grey levels")
+
+
+def bench(transform, clips, repeat):
+    start = time.time()
+    for r in range(repeat):
+        random.seed(r)
+        out = [transform(clip) for clip in clips]
+    return (time.time() - start) * 1000. / (len(clips) * repeat), out
+
+
+def main():
+    args = parser.parse_args()
+    torch.set_num_threads(1)    # one data loading worker
+    dataset = VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        backend=args.backend,
+        phase="Val")
+    clips = []
+    for index in range(min(args.num_clips, len(dataset))):
+        record = dataset.video_list[index]
+        clips.append(dataset._load_images(record.path, dataset._plan_indices(index)["dense"]))
+
+    pipelines = [
+        ("val", [GroupScale(256), GroupCenterCrop(224), Stack(mode=args.mode),
+                 ToTorchFormatTensor(), GroupNormalize()]),
+        ("val uint8", [GroupScale(256), GroupCenterCrop(224), Stack(mode=args.mode)]),
+        ("train", [GroupMultiScaleCrop(224, [1, .875, .75, .66]), GroupRandomHorizontalFlip(),
+                   Stack(mode=args.mode), ToNormalizedTensor()]),
+        ("train uint8", [GroupMultiScaleCrop(224, [1, .875, .75, .66]), GroupRandomHorizontalFlip(),
+                         Stack(mode=args.mode)]),
+    ]
+    for name, ops in pipelines:
+        transform = torchvision.transforms.Compose(ops)
+        base_ms, a = bench(transform, clips, args.repeat)
+        planned = plan_transforms(transform)
+        plan_ms, b = bench(planned, clips, args.repeat)
+        diff = max((x.float() - y.float()).abs().max().item() for x, y in zip(a, b))
+        print("{:>10s}: {:.1f} ms/clip -> {:.1f} ms/clip planned ({:.2f}x), max abs diff {:.4f}".format(
+              name, base_ms, plan_ms, base_ms / plan_ms, diff))
+        # one grey level in output units
+        step = planned.scale.max().item() if getattr(planned, 'scale', None) is not None else 1.
+        assert(diff <= args.max_diff * step + 1e-6), "{} differs by {:.4f} (> {} grey levels)".format(
+            name, diff, args.max_diff)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""
+Loader throughput with float32 clips normalized in the workers vs uint8 clips
+normalized per batch in the main process (--uint8_loader).
+
+python scripts/benchmark_uint8_loader.py data/kinetics400/kinetics_val_list.txt \
+    --data_root data/kinetics400/memmap_256 --backend memmap -b 64 -j 16
+"""
+import os
+import sys
+import time
+import argparse
+
+import torch
+import torchvision
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from lib.dataset import VideoDataSet
+from lib.loader import BatchTransformLoader
+from lib.transforms import *
+
+parser = argparse.ArgumentParser(description="uint8 vs float32 loader benchmark")
+parser.add_argument('list_file', type=str)
+parser.add_argument('--data_root', type=str, required=True)
+parser.add_argument('--backend', type=str, default="image")
+parser.add_argument('--image_tmpl', type=str, default="image_{:06d}.jpg")
+parser.add_argument('--mode', type=str, default="3D")
+parser.add_argument('--t_length', type=int, default=16)
+parser.add_argument('--t_stride', type=int, default=4)
+parser.add_argument('-b', '--batch-size', default=64, type=int)
+parser.add_argument('-j', '--workers', default=8, type=int)
+parser.add_argument('--num_batches', type=int, default=20)
+
+
+def run(args, uint8, device):
+    to_float = [] if uint8 else [ToTorchFormatTensor(), GroupNormalize()]
+    transform = torchvision.transforms.Compose([
+        GroupScale(256),
+        GroupCenterCrop(224),
+        Stack(mode=args.mode),
+        ] + to_float)
+    dataset = VideoDataSet(root_path=args.data_root,
+        list_file=args.list_file,
+        t_length=args.t_length,
+        t_stride=args.t_stride,
+        image_tmpl=args.image_tmpl,
+        transform=transform,
+        backend=args.backend,
+        phase="Val")
+    loader = torch.utils.data.DataLoader(dataset,
+        batch_size=args.batch_size, shuffle=False, drop_last=True,
+        num_workers=args.workers, pin_memory=device.type == 'cuda')
+    if uint8:
+        loader = BatchTransformLoader(loader, BatchNormalize(), device=device)
+    num_clips = 0
+    start = None
+    for i, (input, target) in enumerate(loader):
+        input = input.to(device, non_blocking=True)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        # the first batch includes worker start-up
+        if i == 0:
+            start = time.time()
+            nbytes = input.numel() * (1 if uint8 else 4)
+            continue
+        num_clips += input.shape[0]
+        if i == args.num_batches:
+            break
+    elapsed = time.time() - start
+    print("{:>7s}: {:.1f} clips/s, {:.1f} MB per batch through the worker queue".format(
+          "uint8" if uint8 else "float32", num_clips / elapsed, nbytes / 2.0 ** 20))
+
+
+def main():
+    args = parser.parse_args()
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    run(args, False, device)
+    run(args, True, device)
+
+
+if __name__ == "__main__":
+    main()
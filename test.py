@@ -7,8 +7,10 @@ import torch.optim
 # from sklearn.metrics import confusion_matrix
 
 from lib.dataset import VideoDataSet
+from lib.loader import BatchTransformLoader
 from lib.models import VideoModule, TSN
 from lib.transforms import *
+from lib.tensor_transforms import *
 from lib.utils.tools import AverageMeter, accuracy
 
 import pdb
@@ -31,6 +33,12 @@ parser.add_argument('--t_stride', type=int, default=8)
 parser.add_argument('--crop_fusion_type', type=str, default='avg',
                     choices=['avg', 'max', 'topk'])
 parser.add_argument('--image_tmpl', type=str)
+parser.add_argument('--backend', type=str, default="image", choices=['image', 'packed', 'lmdb', 'video', 'memmap'])
+parser.add_argument('--data_root', type=str, default=None)
+parser.add_argument('--draft_decode', action='store_true')
+parser.add_argument('--decode_threads', default=0, type=int)
+parser.add_argument('--uint8_loader', action='store_true')
+parser.add_argument('--tensor_aug', action='store_true')
 parser.add_argument('--dropout', type=float, default=0.2)
 parser.add_argument('-j', '--workers', default=32, type=int, metavar='N',
                     help='number of data loading workers (default: 4)')
@@ -51,6 +59,8 @@ def main():
 
     data_root = os.path.join(os.path.dirname(os.path.abspath(__file__)), 
                              "data/{}/access".format(args.dataset))
+    if args.data_root is not None:
+        data_root = args.data_root
 
     net = VideoModule(num_class=num_class, 
                       base_model_name=args.arch,
@@ -78,12 +88,19 @@ def main():
               mode=args.mode).cuda()
 
     ## test data
-    test_transform = torchvision.transforms.Compose([
-        GroupOverSample(args.input_size, 256),
-        Stack(mode=args.mode),
-        ToTorchFormatTensor(),
-        GroupNormalize(),
-        ])
+    to_float = [] if args.uint8_loader else [ToNormalizedTensor()]
+    if args.tensor_aug:
+        # 10 crops as views of one scaled clip tensor, flipped in one op
+        test_transform = torchvision.transforms.Compose([
+            ClipToTensor(),
+            TensorOverSample(args.input_size, 256),
+            TensorStack(mode=args.mode),
+            ] + to_float)
+    else:
+        test_transform = torchvision.transforms.Compose([
+            GroupOverSample(args.input_size, 256),
+            Stack(mode=args.mode),
+            ] + to_float)
     test_dataset = VideoDataSet(
         root_path=data_root, 
         list_file=args.test_list,
@@ -91,12 +108,17 @@ def main():
         t_stride=args.t_stride,
         num_segments=args.num_segments,
         image_tmpl=args.image_tmpl,
+        backend=args.backend,
+        draft_decode=args.draft_decode,
+        decode_threads=args.decode_threads,
         transform=test_transform,
         phase="Test")
     test_loader = torch.utils.data.DataLoader(
         test_dataset,
         batch_size=args.batch_size, shuffle=False,
         num_workers=args.workers, pin_memory=True)
+    if args.uint8_loader:
+        test_loader = BatchTransformLoader(test_loader, BatchNormalize(), device='cuda')
     
     # Test
     batch_timer = AverageMeter()